@@ -1,6 +1,7 @@
+from functools import lru_cache
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import AIMessage
+from app.config import CHECKPOINT_BACKEND, REDIS_URL, REDIS_MAX_CONNECTIONS
 from app.agent.state import InterviewState
 from app.agent.nodes import agent_node, tool_node
 
@@ -8,8 +9,7 @@ def should_call_tool(state: InterviewState):
     """Decide if tools should be called"""
     if not state.get("messages"):
         return END # Should not happen, but safeguard
-    last_message = state["messages"][-1]
-    if isinstance(last_message, AIMessage) and last_message.tool_calls:
+    if getattr(state["messages"][-1], "tool_calls", None):
         return "tool_node"
     else:
         return END
@@ -17,19 +17,35 @@ def should_call_tool(state: InterviewState):
 def after_tool(state: InterviewState):
     """Decide next step after tool execution"""
     # state["messages"][-2] is the AIMessage with the tool call
-    ai_message = state["messages"][-2] 
-    if not isinstance(ai_message, AIMessage) or not ai_message.tool_calls:
+    tool_calls = getattr(state["messages"][-2], "tool_calls", None)
+    if not tool_calls:
          return END # Should not happen
 
-    tool_name = ai_message.tool_calls[0]["name"]
+    tool_name = tool_calls[0]["name"]
     
     if tool_name == "update_patient_info":
         return "agent_node"
     else:
         return END
 
+def create_checkpointer():
+    """Create the checkpointer selected by CHECKPOINT_BACKEND"""
+    if CHECKPOINT_BACKEND == "redis":
+        from redis import ConnectionPool, Redis
+        from langgraph.checkpoint.redis import RedisSaver
+        
+        # One pool per process, reused for every checkpoint read/write
+        pool = ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+        saver = RedisSaver(redis_client=Redis(connection_pool=pool))
+        saver.setup()
+        print(f"✓ Redis checkpointer ready → {REDIS_URL}")
+        return saver
+    
+    return MemorySaver()
+
+@lru_cache(maxsize=1)
 def create_agent_graph():
-    """Build and compile the agent graph"""
+    """Build and compile the agent graph (once per process)"""
     builder = StateGraph(InterviewState)
     
     builder.add_node("agent_node", agent_node)
@@ -49,5 +65,4 @@ def create_agent_graph():
         {"agent_node": "agent_node", END: END}
     )
     
-    memory = MemorySaver()
-    return builder.compile(checkpointer=memory)
+    return builder.compile(checkpointer=create_checkpointer())
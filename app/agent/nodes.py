@@ -1,60 +1,151 @@
-import json
+import asyncio
+import orjson
+from typing import Optional
+from uuid import uuid4
+from functools import lru_cache
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import AIMessage, ToolMessage
-from app.config import GOOGLE_API_KEY
+from app.config import (
+    GOOGLE_API_KEY,
+    LLM_MODEL,
+    LLM_TEMPERATURE,
+    LLM_SEMANTIC_CACHE,
+    LLM_CACHE_DISTANCE_THRESHOLD,
+    LLM_CACHE_EMBEDDING_MODEL,
+    REDIS_URL
+)
 from app.agent.state import InterviewState, PatientInfoExtraction
 from app.agent.tools import update_patient_info, end_call, forward_call_to_human
-from app.agent.prompts import build_system_prompt
+from app.agent.prompts import build_prompt_messages, get_pending_questions, FORWARD_REPLY, END_CALL_REPLY
 
-def agent_node(state: InterviewState):
+TOOLS = [update_patient_info, end_call, forward_call_to_human]
+_TOOLS_BY_NAME = {t.name: t for t in TOOLS}
+_UPDATES_STATE = {"update_patient_info"}  # Tools whose output is merged into patient_info
+_TOOL_LOG_LABELS = {
+    "update_patient_info": "Updated",
+    "end_call": "Ending call",
+    "forward_call_to_human": "Forwarding",
+}
+
+@lru_cache(maxsize=2)
+def get_model(cacheable: bool = False):
+    """
+    Build the Gemini client with tools bound, once per process.
+    The cacheable variant reads/writes the global LLM cache; the default
+    one never does. Call get_model.cache_clear() after rotating GOOGLE_API_KEY.
+    """
+    return ChatGoogleGenerativeAI(
+        temperature=LLM_TEMPERATURE,
+        model=LLM_MODEL,
+        api_key=GOOGLE_API_KEY,
+        cache=None if cacheable else False
+    ).bind_tools(TOOLS)
+
+def warm_up_model():
+    """
+    Build the bound model(s) at boot so tool schema generation happens here,
+    not on the first caller's turn.
+    """
+    variants = (False, True) if LLM_SEMANTIC_CACHE else (False,)
+    for cacheable in variants:
+        model = get_model(cacheable=cacheable)
+        if not model.kwargs.get("tools"):
+            raise RuntimeError("Tools failed to bind to the LLM")
+    print(f"✅ LLM client ready: {LLM_MODEL} ({len(TOOLS)} tools bound)")
+
+def init_llm_cache():
+    """Install the Redis semantic cache as the global LangChain LLM cache."""
+    if not LLM_SEMANTIC_CACHE:
+        print("   LLM semantic cache: DISABLED")
+        return
+
+    from langchain_core.globals import set_llm_cache
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from langchain_redis import RedisSemanticCache
+
+    embeddings = HuggingFaceEmbeddings(model_name=LLM_CACHE_EMBEDDING_MODEL)
+    set_llm_cache(RedisSemanticCache(
+        embeddings=embeddings,
+        redis_url=REDIS_URL,
+        distance_threshold=LLM_CACHE_DISTANCE_THRESHOLD
+    ))
+    print(f"✅ LLM semantic cache enabled → {REDIS_URL}")
+
+def is_cacheable_turn(messages) -> bool:
+    """
+    Only the opening greeting is safe to share across calls.
+    Any later turn carries the patient's own answers in its history, and a
+    near-match from another call could echo back someone else's details.
+    """
+    return LLM_SEMANTIC_CACHE and not messages
+
+def scripted_response(patient_info: PatientInfoExtraction) -> Optional[AIMessage]:
+    """
+    Canned reply and tool call for terminal states.
+    Once the form is complete and interest is known there is nothing left
+    for the LLM to decide, so skip the round trip entirely.
+    """
+    if get_pending_questions(patient_info):
+        return None
+    
+    if patient_info.interested is True:
+        content, tool_name, reason = FORWARD_REPLY, "forward_call_to_human", "interested_customer_ready"
+    elif patient_info.interested is False:
+        content, tool_name, reason = END_CALL_REPLY, "end_call", "not_interested"
+    else:
+        return None
+    
+    return AIMessage(
+        content=content,
+        tool_calls=[{"name": tool_name, "args": {"reason": reason}, "id": uuid4().hex}]
+    )
+
+async def agent_node(state: InterviewState):
     """
     Non-streaming version (kept for compatibility with tool execution flow).
     This is used after tool calls to continue the conversation.
     """
     messages = state["messages"]
     patient_info = state.get("patient_info") or PatientInfoExtraction()
-    relevant_history = messages[-6:]
     
-    system_prompt = build_system_prompt(patient_info, has_messages=bool(messages))
+    scripted = scripted_response(patient_info)
+    if scripted is not None:
+        return {"messages": [scripted]}
     
-    tools = [update_patient_info, end_call, forward_call_to_human]
-    model = ChatGoogleGenerativeAI(
-        temperature=0.7,
-        model="gemini-flash-lite-latest",
-        api_key=GOOGLE_API_KEY
-    ).bind_tools(tools)
+    prompt_messages = build_prompt_messages(patient_info, messages)
     
-    response = model.invoke([system_prompt] + relevant_history)
+    model = get_model(cacheable=is_cacheable_turn(messages))
+    response = await model.ainvoke(prompt_messages)
     return {"messages": [response]}
 
 
-def tool_node(state: InterviewState):
-    """Execute tools and update state"""
-    last_message = state["messages"][-1]
-    if not isinstance(last_message, AIMessage):
+async def tool_node(state: InterviewState):
+    """Execute tools concurrently and update state"""
+    last_tool_calls = getattr(state["messages"][-1], "tool_calls", None)
+    if not last_tool_calls:
         return {}
         
-    new_info_obj = state.get('patient_info') or PatientInfoExtraction()
+    info_obj = state.get('patient_info') or PatientInfoExtraction()
+    info_updates = {}
     tool_messages = []
     
-    for tool_call in last_message.tool_calls:
+    tool_calls = [tc for tc in last_tool_calls if tc["name"] in _TOOLS_BY_NAME]
+    outputs = await asyncio.gather(
+        *(_TOOLS_BY_NAME[tc["name"]].ainvoke(tc["args"]) for tc in tool_calls)
+    )
+    
+    # Fold results in call order so later updates win, as before
+    for tool_call, tool_output in zip(tool_calls, outputs):
         tool_name = tool_call["name"]
+        content = tool_output if isinstance(tool_output, str) else orjson.dumps(tool_output).decode()
+        tool_messages.append(ToolMessage(content=content, tool_call_id=tool_call["id"]))
         
-        if tool_name == "update_patient_info":
-            tool_output_json = update_patient_info.invoke(tool_call["args"])
-            tool_messages.append(ToolMessage(content=tool_output_json, tool_call_id=tool_call["id"]))
-            new_data_dict = json.loads(tool_output_json)
-            new_info_obj = new_info_obj.model_copy(update=new_data_dict)
-            print(f"[Tool] Updated: {new_data_dict}")
-            
-        elif tool_name == "end_call":
-            tool_output = end_call.invoke(tool_call["args"])
-            tool_messages.append(ToolMessage(content=tool_output, tool_call_id=tool_call["id"]))
-            print(f"[Tool] Ending call: {tool_call['args']}")
-            
-        elif tool_name == "forward_call_to_human":
-            tool_output = forward_call_to_human.invoke(tool_call["args"])
-            tool_messages.append(ToolMessage(content=tool_output, tool_call_id=tool_call["id"]))
-            print(f"[Tool] Forwarding: {tool_call['args']}")
-    
-    return {"messages": tool_messages, "patient_info": new_info_obj}
+        if tool_name in _UPDATES_STATE:
+            info_updates.update(tool_output)
+        print(f"[Tool] {_TOOL_LOG_LABELS[tool_name]}: {tool_call['args']}")
+    
+    # One shallow copy per turn, however many updates the LLM sent
+    if info_updates:
+        info_obj = info_obj.model_copy(update=info_updates)
+    
+    return {"messages": tool_messages, "patient_info": info_obj}
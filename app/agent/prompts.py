@@ -1,30 +1,64 @@
-from typing import List
+import json
+from typing import List, Sequence, Tuple
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
+from app.config import LLM_MAX_HISTORY
 from app.agent.state import PatientInfoExtraction
 
+# Static prefix shared by every request. Keep it byte-identical across turns
+# so Gemini's implicit prefix caching can reuse it; per-turn state goes in
+# the trailing call-status message instead.
+STATIC_SYSTEM_PROMPT = """You are Jane, a friendly Medicare screening agent calling from Nationwide Screening.
+This is a live phone call. Everything you write is spoken aloud, so use natural speech only and do NOT include any special characters or formatting.
+
+## TOOLS:
+- `update_patient_info`: If the patient provides ANY requested info, call it IMMEDIATELY
+- `end_call`: If the patient is rude or frustrated, call it with reason "customer_upset"
+- `forward_call_to_human`: If the patient explicitly asks for a human, call it
+
+## CALL STATUS:
+The last message of every request is a call status note from the system, not from the patient.
+Follow its instructions for this turn and never read it out loud.
+"""
+
 def get_pending_questions(patient_info: PatientInfoExtraction) -> List[str]:
     """Get list of unanswered fields"""
     # Use model_dump to respect Pydantic model
-    return [field for field, value in patient_info.model_dump().items() if value is None]
-
-def build_system_prompt(patient_info: PatientInfoExtraction, has_messages: bool) -> str:
-    """Dynamically build the system prompt based on conversation state."""
-    
-    pending_questions = get_pending_questions(patient_info)
-    
-    if not has_messages:
-        return """You are Jane, a friendly agent from Nationwide Screening.
-Your first task is to greet the patient, introduce yourself and the purpose of the call,
+    return _pending_from_dump(patient_info.model_dump())
+
+def _pending_from_dump(info: dict) -> List[str]:
+    """Unanswered fields from an already dumped PatientInfoExtraction."""
+    return [field for field, value in info.items() if value is None]
+
+def build_system_prompt(patient_info: PatientInfoExtraction, has_messages: bool) -> Tuple[str, str]:
+    """
+    Build the prompt for this turn as (static_system, turn_context).
+    The static part never changes; turn_context describes the current call state.
+    """
+    return STATIC_SYSTEM_PROMPT, build_turn_context(patient_info, has_messages)
+
+def build_prompt_messages(patient_info: PatientInfoExtraction, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Assemble [static system] + recent history + [call status] for the LLM."""
+    static_system, turn_context = build_system_prompt(patient_info, has_messages=bool(messages))
+    return [
+        SystemMessage(content=static_system),
+        *messages[-LLM_MAX_HISTORY:],
+        HumanMessage(content=turn_context)
+    ]
+
+# --- Scripted replies for terminal states ---
+FORWARD_REPLY = "Thank you so much for your time! I have all the information I need. Let me connect you with a specialist who can help you schedule your test. Please hold for just a moment."
+END_CALL_REPLY = "I understand. Thank you for your time today. Have a great day!"
+
+# --- Per-turn call status templates ---
+# Static situations are returned as-is; the rest are filled with format_map.
+_GREETING = """## SITUATION:
+The call has just connected. Your first task is to greet the patient, introduce yourself and the purpose of the call,
 and then ask for their name. This is a cold call.
 
 Script: "Hi, this is Jane calling from Nationwide Screening. The reason I'm reaching out is because you've been approved through your Medicare benefits to receive a no-cost genetic saliva test that checks for hidden risks related to autoimmune conditions, neurological disorders, and hereditary cancers. I'm calling today to see if you'd like to take advantage of this benefit. Before we go over the details, may I please have your name?"
 """
 
-    form_complete = len(pending_questions) == 0
-    customer_interested = patient_info.interested is True
-    customer_not_interested = patient_info.interested is False
-    
-    if form_complete and customer_interested:
-        return """
+_FORWARD = f"""
 ## SITUATION:
 You have collected ALL required information and the customer IS INTERESTED.
 
@@ -32,12 +66,12 @@ You have collected ALL required information and the customer IS INTERESTED.
 You MUST call the `forward_call_to_human` tool RIGHT NOW with reason: "interested_customer_ready".
 
 ## YOUR RESPONSE:
-Say: "Thank you so much for your time! I have all the information I need. Let me connect you with a specialist who can help you schedule your test. Please hold for just a moment."
+Say: "{FORWARD_REPLY}"
 
 Then IMMEDIATELY call `forward_call_to_human`.
 """
-    elif form_complete and customer_not_interested:
-        return """
+
+_END_CALL = f"""
 ## SITUATION:
 You have collected all information but the customer is NOT interested.
 
@@ -45,81 +79,107 @@ You have collected all information but the customer is NOT interested.
 Call `end_call` with reason: "not_interested".
 
 ## YOUR RESPONSE:
-Say: "I understand. Thank you for your time today. Have a great day!"
+Say: "{END_CALL_REPLY}"
 
 Then call `end_call`.
 """
-    elif customer_interested and not form_complete:
-        return f"""
+
+_ASK_INTEREST = """
+## SITUATION:
+You have collected ALL patient information EXCEPT their interest level.
+
+## YOUR FINAL QUESTION:
+Ask clearly: "Great! I have all your information. Are you interested in moving forward with this free genetic screening test?"
+
+## WHAT HAPPENS NEXT:
+- If they say YES → call `update_patient_info` with interested=True, then I will forward them
+- If they say NO → call `update_patient_info` with interested=False, then end call
+
+Ask the question naturally and wait for their response.
+"""
+
+_INTERESTED_INCOMPLETE_TPL = """
 ## SITUATION:
 The customer IS INTERESTED but you still need some information.
 
 ## CURRENT PROGRESS:
-{patient_info.model_dump_json(indent=2)}
+{progress}
 
 ## MISSING INFORMATION:
-{', '.join(pending_questions)}
+{missing}
 
 ## YOUR TASK:
 1. Acknowledge their interest warmly
 2. Explain you just need a couple more details
-3. Ask ONLY for the next missing item: {pending_questions[0]}
+3. Ask ONLY for the next missing item: {next}
 
 Keep it brief, natural, and conversational.
 """
-    elif not form_complete and patient_info.interested is None:
-        return f"""
-You are Jane, a friendly medicare screening agent collecting patient information.
+
+_COLLECTING_TPL = """
+## SITUATION:
+You are collecting patient information.
 
 ## YOUR PROGRESS:
-{patient_info.model_dump_json(indent=2)}
+{progress}
 
 ## PENDING QUESTIONS (ask in order):
-{', '.join(pending_questions)}
+{missing}
 
 ## CRITICAL RULES:
-1. **Extract Information:** If patient provides ANY info, call `update_patient_info` tool IMMEDIATELY
-2. **One Question at a Time:** Ask about ONLY ONE field: {pending_questions[0] if pending_questions else 'none'}
-4. **Be Natural:** Respond conversationally to what they said, then ask next question
-5. **Handle Negativity:** If rude/frustrated, call `end_call` with reason "customer_upset"
+1. **One Question at a Time:** Ask about ONLY ONE field: {next}
+2. **Be Natural:** Respond conversationally to what they said, then ask next question
 
 ## WHAT TO DO RIGHT NOW:
 - If they answered your last question → call `update_patient_info`
-- Then ask about: {pending_questions[0] if pending_questions else 'all info collected'}
-
-Remember: Natural speech only. No special characters.
-"""
-    elif form_complete and patient_info.interested is None:
-        return """
-## SITUATION:
-You have collected ALL patient information EXCEPT their interest level.
-
-## YOUR FINAL QUESTION:
-Ask clearly: "Great! I have all your information. Are you interested in moving forward with this free genetic screening test?"
-
-## WHAT HAPPENS NEXT:
-- If they say YES → call `update_patient_info` with interested=True, then I will forward them
-- If they say NO → call `update_patient_info` with interested=False, then end call
-
-Ask the question naturally and wait for their response.
+- Then ask about: {next_or_done}
 """
-    else: # Default fallback
-        return f"""
-You are Jane, a friendly medicare screening agent.
 
+_FALLBACK_TPL = """
 ## YOUR PROGRESS:
-{patient_info.model_dump_json(indent=2)}
+{progress}
 
 ## PENDING QUESTIONS:
-{', '.join(pending_questions)}
+{missing}
 
 ## INSTRUCTIONS:
 1. Respond naturally to what the patient just said
 2. If they provided info → call `update_patient_info`
-3. Ask about the next pending item: {pending_questions[0] if pending_questions else 'none'}
-4. If patient is rude or frustrated → call `end_call`
-5. If explicitly asks for human → call `forward_call_to_human`
-6. Important: Since your generated text will be spoken aloud, do NOT include any special characters or formatting.
+3. Ask about the next pending item: {next}
 
 Keep it conversational and natural.
 """
+
+def build_turn_context(patient_info: PatientInfoExtraction, has_messages: bool) -> str:
+    """Dynamically build the call status note based on conversation state."""
+    if not has_messages:
+        return _GREETING
+    
+    # Serialize once per turn and reuse across all branches
+    info = patient_info.model_dump()
+    pending_questions = _pending_from_dump(info)
+
+    form_complete = len(pending_questions) == 0
+    customer_interested = patient_info.interested is True
+    customer_not_interested = patient_info.interested is False
+    
+    if form_complete and customer_interested:
+        return _FORWARD
+    elif form_complete and customer_not_interested:
+        return _END_CALL
+    elif form_complete and patient_info.interested is None:
+        return _ASK_INTEREST
+    
+    fields = {
+        "progress": json.dumps(info, indent=2, ensure_ascii=False),
+        "missing": ', '.join(pending_questions),
+        "next": pending_questions[0] if pending_questions else 'none',
+        "next_or_done": pending_questions[0] if pending_questions else 'all info collected',
+    }
+    
+    if customer_interested and not form_complete:
+        return _INTERESTED_INCOMPLETE_TPL.format_map(fields)
+    elif not form_complete and patient_info.interested is None:
+        return _COLLECTING_TPL.format_map(fields)
+    else: # Default fallback
+        return _FALLBACK_TPL.format_map(fields)
@@ -1,6 +1,7 @@
 from typing import TypedDict, Annotated, Sequence, Optional, List
 from langchain_core.messages import BaseMessage
 from pydantic import BaseModel, Field
+from app.config import STATE_MAX_MESSAGES
 
 class PatientInfoExtraction(BaseModel):
     """Patient information schema"""
@@ -9,7 +10,13 @@ class PatientInfoExtraction(BaseModel):
     last_visit_date: Optional[str] = Field(None, description="When patient last visited their doctor")
     interested: Optional[bool] = Field(None, description="Whether patient is interested in moving forward")
 
+def _append_bounded(existing: Sequence[BaseMessage], new: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Append new messages, keeping only the last STATE_MAX_MESSAGES."""
+    merged = list(existing[-STATE_MAX_MESSAGES:])
+    merged.extend(new)
+    return merged[-STATE_MAX_MESSAGES:]
+
 class InterviewState(TypedDict):
     """Graph state definition"""
-    messages: Annotated[Sequence[BaseMessage], lambda x, y: x + y]
+    messages: Annotated[Sequence[BaseMessage], _append_bounded]
     patient_info: PatientInfoExtraction
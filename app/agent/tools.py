@@ -1,19 +1,27 @@
-import json
 from typing import Optional, List
 from typing_extensions import Annotated
 from langchain_core.tools import tool
+from app.agent.state import PatientInfoExtraction
+
+# Reuse the state schema's descriptions so the tool schema sent to Gemini
+# stays in lockstep with PatientInfoExtraction's four fields
+_FIELDS = PatientInfoExtraction.model_fields
 
 @tool
 def update_patient_info(
-    patient_name: Annotated[Optional[str], "Patient's full name"] = None,
-    medical_conditions: Annotated[Optional[List[str]], "List of any immune-related or neurological or cancer medical conditions"] = None,
-    last_visit_date: Annotated[Optional[str], "When patient last visited their doctor"] = None,
-    interested: Annotated[Optional[bool], "Whether patient is interested in moving forward"] = None,
+    patient_name: Annotated[Optional[str], _FIELDS["patient_name"].description] = None,
+    medical_conditions: Annotated[Optional[List[str]], _FIELDS["medical_conditions"].description] = None,
+    last_visit_date: Annotated[Optional[str], _FIELDS["last_visit_date"].description] = None,
+    interested: Annotated[Optional[bool], _FIELDS["interested"].description] = None,
 ):
     """Update patient information with new data"""
-    locals_copy = locals().copy()
-    updates = {k: v for k, v in locals_copy.items() if v is not None}
-    return json.dumps(updates)
+    fields = {
+        "patient_name": patient_name,
+        "medical_conditions": medical_conditions,
+        "last_visit_date": last_visit_date,
+        "interested": interested,
+    }
+    return {k: v for k, v in fields.items() if v is not None}
 
 
 @tool
@@ -1,11 +1,13 @@
 import asyncio
 import traceback
+import uuid
 from typing import Optional
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from fastapi.responses import StreamingResponse
-from app.audio.stt import transcribe_audio
+from app.audio.stt import transcribe_audio, stt_executor
 from app.streaming.pipeline import llm_producer, tts_consumer, audio_chunk_streamer
 from app.streaming.manager import MedicareAgent
+from app.streaming.buffer import AudioChunkRing
 
 # This will be initialized in main.py and injected
 agent_manager_instance = None
@@ -19,6 +21,12 @@ def get_agent_manager() -> MedicareAgent:
         raise HTTPException(status_code=500, detail="Agent manager not initialized")
     return agent_manager_instance
 
+def _upload_format(audio_bytes: bytes) -> str:
+    """WAV uploads are decoded by soundfile; anything else is taken as raw pcm16k."""
+    if audio_bytes[:4] == b'RIFF' and audio_bytes[8:12] == b'WAVE':
+        return "wav"
+    return "pcm16k"
+
 # Create router
 router = APIRouter()
 
@@ -41,25 +49,29 @@ async def process_voice_message_streaming(
     This is your test endpoint from the second app.py.
     """
     try:
+        # A generated session has no checkpoint worth prefetching
+        resumed_session = bool(session_id)
         if not session_id:
-            session_id = f"test_session_{asyncio.get_event_loop().time()}"
+            session_id = f"test_session_{uuid.uuid4().hex}"
 
-        # 1. Transcribe (blocking)
+        # 1. Transcribe while the session checkpoint loads
         audio_bytes = await audio.read()
-        user_text = await asyncio.get_event_loop().run_in_executor(
-            None, transcribe_audio, audio_bytes
+        transcription = asyncio.get_running_loop().run_in_executor(
+            stt_executor, transcribe_audio, audio_bytes, _upload_format(audio_bytes)
         )
+        state = await agent.prewarm_session(session_id) if resumed_session else None
+        user_text = await transcription
         print(f"[{session_id}] User said: {user_text}")
         
         # 2. Create queues and event
         sentence_queue = asyncio.Queue(maxsize=10)
-        audio_queue = asyncio.Queue(maxsize=5)
+        audio_queue = AudioChunkRing(maxlen=5)
         # Create a dummy event for the HTTP endpoint
         interruption_event = asyncio.Event() 
         
         # 3. Start concurrent tasks
         producer_task = asyncio.create_task(
-            llm_producer(session_id, user_text, sentence_queue, interruption_event)
+            llm_producer(session_id, user_text, sentence_queue, interruption_event, state)
         )
         consumer_task = asyncio.create_task(
             tts_consumer(sentence_queue, audio_queue, interruption_event, output_format="wav")
@@ -1,15 +1,30 @@
 import asyncio
-import json
-import base64
-import traceback
+import collections
+import logging
+import msgspec
+import orjson
+import os
+import struct
 import numpy as np
 from pathlib import Path
+from typing import Optional, Union
+try:
+    # SIMD (AVX2/AVX-512/NEON) base64, returning str directly
+    from pybase64 import b64encode_as_string
+except ImportError:
+    import base64
+    
+    def b64encode_as_string(data) -> str:
+        return base64.b64encode(data).decode("ascii")
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from app.streaming.manager import MedicareAgent
 from app.api.http import get_agent_manager
-from app.audio.stt import transcribe_audio
+from app.audio import stt
+from app.audio.utils import PCM8kTo16kUpsampler, get_resample_pool, ulaw_to_int16
 from app.audio import vad
+from app.audio.preproc import preemphasis_and_rms
 from app.streaming.pipeline import llm_producer, tts_consumer
+from app.streaming.buffer import AudioChunkRing, PCMByteBuffer, UtteranceBuffer
 
 # Import all config variables
 from app.config import (
@@ -24,101 +39,243 @@ from app.config import (
     AUDIO_LOG_DIR,
     DEBUG_PRINT_AUDIO_STATS,
     DEBUG_PRINT_VAD_DECISIONS,
-    AUDIO_QUEUE_CHECK_INTERVAL,
     VAD_CHUNK_BYTES,
+    AUDIO_QUEUE_MAX_CHUNKS,
+    SENTENCE_QUEUE_MAX,
+    TRANSCRIPT_QUEUE_MAX,
     MS_PER_VAD_CHUNK,
-    AGENT_SAMPLE_RATE
+    AUDIO_COALESCE_BYTES,
+    AUDIO_COALESCE_MAX_ITEMS,
+    AUDIO_COALESCE_LINGER_MS,
+    AGENT_SAMPLE_RATE,
+    RESAMPLE_WORKERS
 )
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# --- BINARY FRAME PROTOCOL ---
+# Clients that connect with ?proto=binary exchange binary frames:
+# 1-byte type tag followed by the payload.
+#   0x01 audio       raw PCM16 @ 16kHz (both directions)
+#   0x05 audio 8k    raw PCM16 @ 8kHz, upsampled here (client → server)
+#   0x02 interrupt   4-byte big-endian epoch (server → client)
+#   0x03 transcript  UTF-8 text (server → client)
+#   0x04 hangup      no payload (client → server)
+#   0x06 resume      4-byte big-endian epoch (server → client, media socket);
+#                    audio before it belongs to the interrupted turn
+# Inbound JSON is still accepted as a text frame or a binary frame starting with '{'.
+FRAME_AUDIO = 0x01
+FRAME_INTERRUPT = 0x02
+FRAME_TRANSCRIPT = 0x03
+FRAME_HANGUP = 0x04
+FRAME_AUDIO_8K = 0x05
+FRAME_RESUME = 0x06
+FRAME_AUDIO_TAG = bytes([FRAME_AUDIO])
+_EPOCH = struct.Struct(">I")  # Interrupt/resume epoch payload
+_JSON_OBJECT_START = ord("{")  # Binary frames starting with '{' carry JSON
+_CONTROL_TAGS = {
+    "interrupt": bytes([FRAME_INTERRUPT]),
+    "transcript": bytes([FRAME_TRANSCRIPT]),
+}
+
+# JSON audio envelope for text-mode clients; only the base64 payload varies
+_AUDIO_PREFIX = f'{{"type":"audio_response","format":"pcm16k","sample_rate":{AGENT_SAMPLE_RATE},"audio":"'
+_AUDIO_SUFFIX = '"}'
+
+# Inbound JSON messages, decoded straight into typed structs; the base64
+# audio field is decoded to bytes by msgspec during parsing
+class AudioDataMessage(msgspec.Struct, tag="audio_data", tag_field="type"):
+    audio: bytes
+    format: Optional[str] = None
+
+class HangupMessage(msgspec.Struct, tag="hangup", tag_field="type"):
+    pass
+
+_inbound_decoder = msgspec.json.Decoder(Union[AudioDataMessage, HangupMessage])
 
 # Create audio log directory if logging is enabled
 if ENABLE_AUDIO_LOGGING:
     AUDIO_LOG_DIR.mkdir(exist_ok=True)
 
 # Audio logging helper
-_audio_counters = {}
+_audio_counters = collections.Counter()  # (session_id, stage) -> files written
+
+def _noop(*args):
+    """Stand-in for debug hooks that are switched off."""
 
-def save_audio_chunk(audio_bytes: bytes, session_id: str, stage: str):
+def _save_audio_chunk(audio_bytes: bytes | bytearray | memoryview, session_id: str, stage: str):
     """Save audio chunk for debugging."""
-    if not ENABLE_AUDIO_LOGGING:
-        return
-    
-    if session_id not in _audio_counters:
-        _audio_counters[session_id] = {}
-    if stage not in _audio_counters[session_id]:
-        _audio_counters[session_id][stage] = 0
-    
-    counter = _audio_counters[session_id][stage]
+    key = (session_id, stage)
+    counter = _audio_counters[key]
     filename = AUDIO_LOG_DIR / f"{session_id}_{stage}_{counter:04d}.raw"
     
     try:
-        with open(filename, "wb") as f:
-            f.write(audio_bytes)
-        _audio_counters[session_id][stage] += 1
+        # Raw dump; unbuffered os-level write, no file object
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, audio_bytes)
+        finally:
+            os.close(fd)
+        _audio_counters[key] = counter + 1
     except Exception as e:
         print(f"[{session_id}] Failed to save audio: {e}")
 
-async def clear_async_queue(q: asyncio.Queue):
-    """Remove all items from an asyncio Queue."""
+# Resolved once: with audio logging off every call site is a no-op
+save_audio_chunk = _save_audio_chunk if ENABLE_AUDIO_LOGGING else _noop
+
+# Optional per-session control sockets (/ws/vicidial_ctrl/{session_id}).
+# Interrupts and transcripts go here when present so they never queue
+# behind bulk audio on the media socket.
+_control_sockets = {}
+
+# Media sessions that negotiated the binary frame protocol
+_binary_sessions = set()
+
+async def send_control(websocket: WebSocket, session_id: str, message: dict):
+    """
+    Send a control message on the session's control socket (JSON), else on
+    the media socket as a tagged binary frame or JSON, per the session's protocol.
+    """
+    control = _control_sockets.get(session_id)
+    if control is not None:
+        await control.send_text(orjson.dumps(message).decode())
+    elif session_id in _binary_sessions:
+        tag = _CONTROL_TAGS[message["type"]]
+        if "text" in message:
+            await websocket.send_bytes(tag + message["text"].encode())
+        elif "epoch" in message:
+            await websocket.send_bytes(tag + _EPOCH.pack(message["epoch"]))
+        else:
+            await websocket.send_bytes(tag)
+    else:
+        await websocket.send_text(orjson.dumps(message).decode())
+
+def fast_clear(q) -> int:
+    """
+    Drop all items from an asyncio Queue or AudioChunkRing in O(1) and
+    return how many. Resets the deque behind the queue directly; falls
+    back to draining item by item if the private attributes aren't there.
+    """
+    if isinstance(q, AudioChunkRing):
+        return q.clear()
+    assert isinstance(q, asyncio.Queue)
+    items = getattr(q, "_queue", None)
+    
+    if isinstance(items, collections.deque) and all(
+        hasattr(q, attr) for attr in ("_unfinished_tasks", "_finished", "_putters", "_wakeup_next")
+    ):
+        dropped = len(items)
+        items.clear()
+        q._unfinished_tasks = max(0, q._unfinished_tasks - dropped)
+        if q._unfinished_tasks == 0:
+            q._finished.set()
+        # Free slots for producers blocked on put()
+        for _ in range(min(dropped, len(q._putters))):
+            q._wakeup_next(q._putters)
+        return dropped
+    
+    dropped = 0
     while not q.empty():
         try:
             q.get_nowait()
             q.task_done()
+            dropped += 1
         except asyncio.QueueEmpty:
             break
+    return dropped
 
 async def audio_sender_task(
     websocket: WebSocket,
-    audio_queue: asyncio.Queue,
+    audio_queue: AudioChunkRing,
     interruption_event: asyncio.Event,
     agent_is_speaking_event: asyncio.Event,
-    session_id: str
+    session_id: str,
+    binary_audio: bool = False
 ):
     """
     Audio sender with IMMEDIATE interruption handling.
-    Uses config: AUDIO_QUEUE_CHECK_INTERVAL, ENABLE_AUDIO_LOGGING
+    Wakes only on queued audio or an interruption (no polling).
+    Uses config: ENABLE_AUDIO_LOGGING
     """
+    get_task = None
+    interrupt_task = None
+    # Numbers each interrupt; the relay drops audio until the matching resume
+    epoch = 0
+    
+    # Hot-path bindings (looked up once, not per chunk)
+    loop = asyncio.get_running_loop()
+    is_interrupted = interruption_event.is_set
+    send_bytes = websocket.send_bytes
+    send_text = websocket.send_text
+    b64encode = b64encode_as_string
+    frame_prefix = FRAME_AUDIO_TAG if binary_audio else b""
+    
+    def discard_pending() -> int:
+        """Drop queued audio and any chunk the pending get already took."""
+        nonlocal get_task
+        dropped = fast_clear(audio_queue)
+        if get_task is not None and get_task.done():
+            get_task = None
+            audio_queue.task_done()
+            dropped += 1
+        return dropped
+    
     try:
         while True:
             # CRITICAL: Check interruption BEFORE attempting to get audio
-            if interruption_event.is_set():
+            if is_interrupted():
                 print(f"[{session_id}] 🚨 INTERRUPT ACTIVE - Sending stop signal")
                 
                 # 1. Send interrupt to relay IMMEDIATELY
-                await websocket.send_json({"type": "interrupt"})
+                epoch += 1
+                await send_control(websocket, session_id, {"type": "interrupt", "epoch": epoch})
                 
-                # 2. Clear all pending audio
-                cleared = 0
-                while not audio_queue.empty():
-                    try:
-                        audio_queue.get_nowait()
-                        audio_queue.task_done()
-                        cleared += 1
-                    except asyncio.QueueEmpty:
-                        break
-                
-                if cleared > 0:
-                    print(f"[{session_id}] 🗑️  Cleared {cleared} audio chunks from queue")
+                # 2. Clear all pending audio (this task is the only one that
+                # drains audio_queue; agent_handler_task just cancels the pipeline)
+                cleared = discard_pending()
                 
                 # 3. Reset flags AFTER clearing
                 interruption_event.clear()
                 agent_is_speaking_event.clear()
                 print(f"[{session_id}] 🔇 Agent interrupted and stopped (flag cleared)")
                 
-                # 4. Small delay to ensure relay processes interrupt
+                # 4. Small delay to ensure relay processes interrupt, then sweep
+                # up audio queued before the pipeline's cancellation landed
                 await asyncio.sleep(0.05)
+                cleared += discard_pending()
+                
+                if cleared > 0:
+                    print(f"[{session_id}] 🗑️  Cleared {cleared} audio chunks from queue")
+                
+                # 5. Mark the turn boundary on the media socket: everything sent
+                # before this is stale, anything after belongs to the next turn
+                if binary_audio:
+                    await send_bytes(bytes([FRAME_RESUME]) + _EPOCH.pack(epoch))
+                else:
+                    await send_text(orjson.dumps({"type": "resume", "epoch": epoch}).decode())
                 continue
             
-            # Non-blocking queue check with configurable timeout
-            try:
-                audio_chunk = await asyncio.wait_for(
-                    audio_queue.get(), 
-                    timeout=AUDIO_QUEUE_CHECK_INTERVAL
-                )
-            except asyncio.TimeoutError:
+            # Race the next chunk against an interruption; the pending
+            # get is reused across iterations rather than recreated
+            if get_task is None:
+                get_task = asyncio.create_task(audio_queue.get())
+            if interrupt_task is None:
+                interrupt_task = asyncio.create_task(interruption_event.wait())
+            
+            await asyncio.wait(
+                {get_task, interrupt_task},
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            
+            if interrupt_task.done():
+                interrupt_task = None
+            if not get_task.done():
                 continue
             
+            audio_chunk = get_task.result()
+            get_task = None
+            
             if audio_chunk is None:
                 print(f"[{session_id}] Audio sender: Turn complete sentinel")
                 audio_queue.task_done()
@@ -129,22 +286,60 @@ async def audio_sender_task(
                 continue
 
             # Double-check interruption before sending
-            if interruption_event.is_set():
+            if is_interrupted():
                 audio_queue.task_done()
                 continue
 
+            # Coalesce small chunks into one frame (bounded for interrupt latency),
+            # lingering briefly for fragments the TTS hasn't queued yet
+            turn_complete = False
+            frame = None
+            if len(audio_chunk) < AUDIO_COALESCE_BYTES:
+                # Binary frames are assembled with their tag in place, so a
+                # merged chunk is copied once rather than again for the tag
+                combined = bytearray(frame_prefix)
+                combined.extend(audio_chunk)
+                coalesce_limit = AUDIO_COALESCE_BYTES + len(frame_prefix)
+                drained = 0
+                linger_deadline = loop.time() + AUDIO_COALESCE_LINGER_MS / 1000
+                while len(combined) < coalesce_limit and drained < AUDIO_COALESCE_MAX_ITEMS:
+                    try:
+                        next_chunk = audio_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        remaining = linger_deadline - loop.time()
+                        if remaining <= 0 or is_interrupted():
+                            break
+                        try:
+                            next_chunk = await asyncio.wait_for(audio_queue.get(), remaining)
+                        except asyncio.TimeoutError:
+                            break
+                    audio_queue.task_done()
+                    if next_chunk is None:
+                        turn_complete = True
+                        break
+                    combined.extend(next_chunk)
+                    drained += 1
+                if drained:
+                    frame = bytes(combined)
+                    audio_chunk = memoryview(frame)[len(frame_prefix):]
+                
+                # An interrupt may have landed while lingering
+                if is_interrupted():
+                    continue
+
             # Log TTS output if enabled
             save_audio_chunk(audio_chunk, session_id, "tts_output")
 
-            chunk_b64 = base64.b64encode(audio_chunk).decode('utf-8')
-            await websocket.send_json({
-                "type": "audio_response",
-                "audio": chunk_b64,
-                "format": "pcm16k",
-                "sample_rate": AGENT_SAMPLE_RATE
-            })
+            if binary_audio:
+                await send_bytes(frame if frame is not None else FRAME_AUDIO_TAG + audio_chunk)
+            else:
+                await send_text(_AUDIO_PREFIX + b64encode(audio_chunk) + _AUDIO_SUFFIX)
             audio_queue.task_done()
             
+            if turn_complete:
+                agent_is_speaking_event.clear()
+                print(f"[{session_id}] 🔇 Agent finished speaking (flag cleared)")
+            
             # CRITICAL: Small delay to allow receiver to process incoming audio
             # This ensures barge-in detection has a chance to run
             await asyncio.sleep(0.005)  # 5ms
@@ -154,20 +349,24 @@ async def audio_sender_task(
     except asyncio.CancelledError:
         print(f"[{session_id}] Audio sender cancelled.")
     except Exception as e:
-        print(f"[{session_id}] Audio sender error: {e}")
-        traceback.print_exc()
+        logger.exception("[%s] Audio sender error: %s", session_id, e)
     finally:
+        for task in (get_task, interrupt_task):
+            if task is not None and not task.done():
+                task.cancel()
         print(f"[{session_id}] Audio sender task exiting.")
 
 
 async def agent_handler_task(
     session_id: str,
     transcript_queue: asyncio.Queue,
-    audio_queue: asyncio.Queue,
+    audio_queue: AudioChunkRing,
     agent_is_speaking_event: asyncio.Event,
     interruption_event: asyncio.Event
 ):
     """Agent LLM/TTS pipeline handler."""
+    # One sentence queue for the whole call, emptied at each turn boundary
+    sentence_queue = asyncio.Queue(maxsize=SENTENCE_QUEUE_MAX)
     try:
         while True:
             transcript = await transcript_queue.get()
@@ -178,48 +377,44 @@ async def agent_handler_task(
             interruption_event.clear()
             agent_is_speaking_event.set()
             
-            sentence_queue = asyncio.Queue()
-            
-            producer_task = asyncio.create_task(
-                llm_producer(session_id, transcript, sentence_queue, interruption_event)
-            )
-            
-            consumer_task = asyncio.create_task(
-                tts_consumer(sentence_queue, audio_queue, interruption_event, output_format="pcm16k")
-            )
-            
-            # IMPORTANT: Set speaking flag AFTER tasks are created
-            # This ensures the flag is set before audio starts flowing
-            print(f"[{session_id}] 🔊 Agent is now speaking (flag set)")
-
-            interruption_wait_task = asyncio.create_task(
-                interruption_event.wait()
-            )
-            
-            done, pending = await asyncio.wait(
-                [producer_task, interruption_wait_task],
-                return_when=asyncio.FIRST_COMPLETED
-            )
-            
-            if interruption_wait_task in done:
-                print(f"[{session_id}] 🚨 INTERRUPTION - Killing pipeline")
-                
-                # Cancel tasks
-                producer_task.cancel()
-                consumer_task.cancel()
+            # The TaskGroup owns this turn's tasks and awaits any it cancels
+            async with asyncio.TaskGroup() as tg:
+                producer_task = tg.create_task(
+                    llm_producer(session_id, transcript, sentence_queue, interruption_event)
+                )
+                consumer_task = tg.create_task(
+                    tts_consumer(sentence_queue, audio_queue, interruption_event, output_format="pcm16k")
+                )
+                interruption_wait_task = tg.create_task(interruption_event.wait())
                 
-                # Clear queues
-                await clear_async_queue(sentence_queue)
-                await clear_async_queue(audio_queue)
+                # IMPORTANT: Set speaking flag AFTER tasks are created
+                # This ensures the flag is set before audio starts flowing
+                print(f"[{session_id}] 🔊 Agent is now speaking (flag set)")
                 
-                # Wait for cancellation
-                await asyncio.gather(producer_task, consumer_task, return_exceptions=True)
+                done, _ = await asyncio.wait(
+                    {producer_task, interruption_wait_task},
+                    return_when=asyncio.FIRST_COMPLETED
+                )
                 
+                interrupted = interruption_wait_task in done
+                if interrupted:
+                    print(f"[{session_id}] 🚨 INTERRUPTION - Killing pipeline")
+                    # audio_sender_task drains audio_queue
+                    producer_task.cancel()
+                    consumer_task.cancel()
+                    # Make room for the cancelled producer's sentinel put; with
+                    # the consumer gone, a full queue would block the TaskGroup
+                    fast_clear(sentence_queue)
+                else:
+                    print(f"[{session_id}] LLM finished naturally, waiting for TTS.")
+                    interruption_wait_task.cancel()
+                    await consumer_task
+            
+            # Drop anything a cancelled producer left for the next turn
+            fast_clear(sentence_queue)
+            
+            if interrupted:
                 print(f"[{session_id}] ✅ Pipeline stopped, ready for new input")
-            else:
-                print(f"[{session_id}] LLM finished naturally, waiting for TTS.")
-                interruption_wait_task.cancel()
-                await consumer_task
 
             # DON'T clear agent_is_speaking_event here!
             # It will be cleared by audio_sender_task when it sends the last chunk
@@ -228,8 +423,7 @@ async def agent_handler_task(
     except asyncio.CancelledError:
         print(f"[{session_id}] Agent handler cancelled.")
     except Exception as e:
-        print(f"[{session_id}] Agent handler error: {e}")
-        traceback.print_exc()
+        logger.exception("[%s] Agent handler error: %s", session_id, e)
     finally:
         agent_is_speaking_event.clear()
         print(f"[{session_id}] Agent handler exiting.")
@@ -251,9 +445,28 @@ async def audio_receiver_task(
         print(f"[{session_id}] VAD model not loaded.")
         return
 
+    # Telephony clients may send 8kHz (PCM16 or mu-law) audio; upsampled per call with carried state
+    upsampler = PCM8kTo16kUpsampler()
+    resample_pool = get_resample_pool(RESAMPLE_WORKERS, session_id) if RESAMPLE_WORKERS > 0 else None
+    
     # VAD state
-    pcm16k_buffer = bytearray()
-    speech_buffer_pcm = bytearray()
+    pcm16k_buffer = PCMByteBuffer()
+    # The STT worker keeps its own copy; the bytes here are only kept for audio logging
+    speech_buffer_pcm = UtteranceBuffer(store=ENABLE_AUDIO_LOGGING)
+    
+    # Hot-path bindings (looked up once, not per chunk)
+    energy_threshold = MIN_AUDIO_ENERGY * 1.5  # 1.5x threshold for better filtering
+    agent_is_speaking = agent_is_speaking_event.is_set
+    is_interrupted = interruption_event.is_set
+    receive = websocket.receive
+    decode_message = _inbound_decoder.decode
+    buffer_extend = pcm16k_buffer.extend
+    buffer_take = pcm16k_buffer.take
+    vad_executor = vad.get_vad_executor(session_id)
+    is_chunks_speech = vad.is_chunks_speech
+    alpha = PREEMPHASIS_ALPHA
+    ms_per_chunk = MS_PER_VAD_CHUNK
+    vad_chunk_samples = VAD_CHUNK_BYTES // 2
     is_speaking = False
     speech_chunks = 0  # Count consecutive speech chunks
     silent_chunks = 0
@@ -265,26 +478,51 @@ async def audio_receiver_task(
     # Barge-in protection
     consecutive_speech_during_agent = 0
     
-    def apply_preemphasis(audio_bytes: bytes) -> bytes:
+    loop = asyncio.get_running_loop()
+    
+    async def upsample_8k(pcm8k_chunk) -> None:
         """
-        Apply pre-emphasis filter to boost high frequencies.
-        Uses PREEMPHASIS_ALPHA from config.
+        Upsample into pcm16k_buffer: inline straight into its free space, or
+        via the resample process pool when configured (nothing while its
+        batch fills).
         """
-        audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
-        audio_float = audio_int16.astype(np.float32) / 32768.0
-        
-        # Pre-emphasis: y[n] = x[n] - alpha * x[n-1]
-        emphasized = np.append(audio_float[0], audio_float[1:] - PREEMPHASIS_ALPHA * audio_float[:-1])
-        
-        # Convert back to int16
-        emphasized = np.clip(emphasized * 32768.0, -32768, 32767)
-        return emphasized.astype(np.int16).tobytes()
+        if resample_pool is None:
+            upsampler.process_into(pcm8k_chunk, pcm16k_buffer)
+        else:
+            buffer_extend(await upsampler.process_in_pool(pcm8k_chunk, loop, resample_pool))
+    
+    def feed_speech(chunk):
+        """Buffer a speech chunk and stream it to the STT worker."""
+        written = speech_buffer_pcm.extend(chunk)
+        if written:
+            loop.run_in_executor(stt.stt_executor, stt.feed, session_id, bytes(chunk[:written]))
+    
+    # Debug hooks resolved once: disabled ones are no-ops, so the per-chunk
+    # loop has no flag checks and formats nothing
+    save_vad_input = save_audio_chunk
+    if DEBUG_PRINT_VAD_DECISIONS:
+        def log_low_energy(energy):
+            logger.debug("[%s] 🔇 Low energy: %.4f < %.4f", session_id, energy, energy_threshold)
+        def log_vad(energy, is_speech):
+            logger.debug("[%s] VAD: %s energy=%.4f", session_id, '🗣️' if is_speech else '🤐', energy)
+        def log_agent_overlap(chunks, energy):
+            logger.debug("[%s] 🔊 Speech during agent playback: %d chunks (energy=%.4f)", session_id, chunks, energy)
+        def log_overlap_reset():
+            logger.debug("[%s] ⚠️  Speech detected but agent_is_speaking=False (counter reset)", session_id)
+    else:
+        log_low_energy = log_vad = log_agent_overlap = log_overlap_reset = _noop
+    if DEBUG_PRINT_AUDIO_STATS:
+        def log_speech_start(energy):
+            logger.info("[%s] 🎤 User speaking (energy: %.4f)", session_id, energy)
+        def log_speech_end(chunks):
+            logger.info("[%s] 🛑 End of speech (%d chunks, %.0fms)", session_id, chunks, chunks * ms_per_chunk)
+    else:
+        log_speech_start = log_speech_end = _noop
     
-    def calculate_rms_energy(audio_bytes: bytes) -> float:
-        """Calculate RMS energy of audio chunk."""
-        audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
-        audio_float = audio_int16.astype(np.float32) / 32768.0
-        return np.sqrt(np.mean(audio_float ** 2))
+    # Pre-emphasized copy of the ready VAD chunks, reused across receives
+    # (grown only for larger batches); the filter carries its last sample
+    emphasized_block = np.empty(VAD_CHUNK_BYTES // 2, dtype=np.int16)
+    preemphasis_prev = 0.0
     
     if DEBUG_PRINT_AUDIO_STATS:
         print(f"[{session_id}] 📊 VAD Config:")
@@ -297,146 +535,216 @@ async def audio_receiver_task(
     
     try:
         while True:
-            data = await websocket.receive_text()
-            msg = json.loads(data)
+            message = await receive()
             
-            if msg['type'] == 'hangup':
-                print(f"[{session_id}] 📞 Hangup received")
-                await transcript_queue.put(None)
+            # Dispatch on the tag byte straight from the ASGI message; audio
+            # frames never touch the disconnect check or the JSON path
+            data = message.get("bytes")
+            tag = data[0] if data else None
+            if tag == FRAME_AUDIO_8K:
+                await upsample_8k(memoryview(data)[1:])
+            elif tag == FRAME_AUDIO:
+                buffer_extend(memoryview(data)[1:])
+            elif tag == FRAME_HANGUP:
+                logger.info("[%s] 📞 Hangup received", session_id)
                 break
+            elif tag is not None and tag != _JSON_OBJECT_START:
+                continue  # Unknown binary frame
+            else:
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                
+                payload = message.get("text") if data is None else data
+                if not payload:
+                    continue
+                
+                # JSON envelope; binary-frame JSON is parsed without a UTF-8 decode
+                try:
+                    msg = decode_message(payload)
+                except msgspec.DecodeError as e:
+                    # Malformed JSON or an unknown message type (ValidationError)
+                    logger.warning("[%s] Dropping inbound frame: %s", session_id, e)
+                    continue
+                
+                match msg:
+                    case HangupMessage():
+                        logger.info("[%s] 📞 Hangup received", session_id)
+                        break
+                    case AudioDataMessage(audio=audio, format="pcm16k"):
+                        buffer_extend(audio)
+                    case AudioDataMessage(audio=audio, format="pcm8k"):
+                        await upsample_8k(audio)
+                    case AudioDataMessage(audio=audio, format="mulaw"):
+                        # Same per-call upsampler as pcm8k, so its carried
+                        # history keeps chunk boundaries click-free
+                        await upsample_8k(ulaw_to_int16(audio))
+                    case _:
+                        continue
             
-            if msg['type'] != 'audio_data' or msg.get('format') != 'pcm16k':
+            # Slice off every VAD-sized chunk that is ready
+            ready_count = pcm16k_buffer.available() // VAD_CHUNK_BYTES
+            if not ready_count:
                 continue
             
-            pcm16k_chunk = base64.b64decode(msg['audio'])
+            # One contiguous take; released below before the next extend()
+            ready_block = buffer_take(ready_count * VAD_CHUNK_BYTES)
+            raw_samples = np.frombuffer(ready_block, dtype=np.int16)
+            if len(raw_samples) > len(emphasized_block):
+                emphasized_block = np.empty(len(raw_samples), dtype=np.int16)
+            emphasized = emphasized_block[:len(raw_samples)]
+            
+            # Pre-emphasis filter and per-chunk RMS energy in a single pass
+            energies, preemphasis_prev = preemphasis_and_rms(
+                raw_samples, emphasized, preemphasis_prev, alpha, vad_chunk_samples
+            )
+            energies = energies.tolist()
+            del raw_samples
             
-            # Apply pre-emphasis filter
-            pcm16k_chunk = apply_preemphasis(pcm16k_chunk)
+            # Zero-copy per-chunk views of the filtered audio
+            emphasized_bytes = memoryview(emphasized).cast('B')
+            ready_chunks = [
+                emphasized_bytes[offset:offset + VAD_CHUNK_BYTES]
+                for offset in range(0, len(emphasized_bytes), VAD_CHUNK_BYTES)
+            ]
             
-            pcm16k_buffer.extend(pcm16k_chunk)
+            # Score the chunks that pass the energy gate in one hop to the VAD
+            # thread (one model call per chunk, in stream order) so the event
+            # loop keeps serving the sender
+            voiced_chunks = [
+                chunk for chunk, energy in zip(ready_chunks, energies)
+                if energy >= energy_threshold
+            ]
+            vad_results = iter(
+                await loop.run_in_executor(vad_executor, is_chunks_speech, voiced_chunks)
+                if voiced_chunks else ()
+            )
 
-            # Process in VAD-sized chunks
-            while len(pcm16k_buffer) >= VAD_CHUNK_BYTES:
-                current_chunk = pcm16k_buffer[:VAD_CHUNK_BYTES]
-                pcm16k_buffer = pcm16k_buffer[VAD_CHUNK_BYTES:]
-                
+            # Replay results through the endpointing state machine
+            for current_chunk, energy in zip(ready_chunks, energies):
                 # Log VAD input if enabled
-                save_audio_chunk(current_chunk, session_id, "vad_input")
-                
-                # Quality check: Ensure chunk has sufficient energy
-                energy = calculate_rms_energy(current_chunk)
+                save_vad_input(current_chunk, session_id, "vad_input")
                 
                 # STRICTER: Increase threshold slightly to reduce false positives
-                if energy < MIN_AUDIO_ENERGY * 1.5:  # 1.5x threshold for better filtering
-                    if DEBUG_PRINT_VAD_DECISIONS:
-                        print(f"[{session_id}] 🔇 Low energy: {energy:.4f} < {MIN_AUDIO_ENERGY * 1.5:.4f}")
+                if energy < energy_threshold:
+                    log_low_energy(energy)
                     
                     if is_speaking:
                         silent_chunks += 1
-                        speech_buffer_pcm.extend(current_chunk)
+                        feed_speech(current_chunk)
                         if silent_chunks >= SILENT_CHUNKS_FOR_EOS:
                             # End of speech
                             is_speaking = False
                             await process_speech_buffer(
                                 speech_buffer_pcm, session_id, websocket, 
-                                transcript_queue, speech_chunks, MIN_SPEECH_CHUNKS
+                                transcript_queue, speech_chunks, MIN_SPEECH_CHUNKS, loop
                             )
-                            speech_buffer_pcm.clear()
+                            speech_buffer_pcm.reset()
                             speech_chunks = 0
                             silent_chunks = 0
                     continue
                 
-                # Run VAD
-                is_speech = vad.is_chunk_speech(current_chunk)
+                # VAD result for this chunk
+                is_speech = next(vad_results)
                 
-                if DEBUG_PRINT_VAD_DECISIONS:
-                    print(f"[{session_id}] VAD: {'🗣️' if is_speech else '🤐'} energy={energy:.4f}")
+                log_vad(energy, is_speech)
                 
                 if is_speech:
                     # Speech detected
-                    if agent_is_speaking_event.is_set():
+                    if agent_is_speaking():
                         consecutive_speech_during_agent += 1
                         
-                        if DEBUG_PRINT_VAD_DECISIONS:
-                            print(f"[{session_id}] 🔊 Speech during agent playback: {consecutive_speech_during_agent} chunks (energy={energy:.4f})")
+                        log_agent_overlap(consecutive_speech_during_agent, energy)
                         
                         # BARGE-IN: Need multiple consecutive speech chunks
                         if consecutive_speech_during_agent >= MIN_BARGEIN_SPEECH_CHUNKS:
-                            if not interruption_event.is_set():
-                                duration_ms = consecutive_speech_during_agent * MS_PER_VAD_CHUNK
-                                print(f"[{session_id}] 💥 BARGE-IN DETECTED! ({consecutive_speech_during_agent} chunks, {duration_ms:.0f}ms, energy={energy:.4f})")
+                            if not is_interrupted():
+                                duration_ms = consecutive_speech_during_agent * ms_per_chunk
+                                logger.info("[%s] 💥 BARGE-IN DETECTED! (%d chunks, %.0fms, energy=%.4f)", session_id, consecutive_speech_during_agent, duration_ms, energy)
                                 interruption_event.set()
                                 
                                 # Log for debugging
-                                print(f"[{session_id}] 🚨 Interruption event SET - agent should stop now")
+                                logger.info("[%s] 🚨 Interruption event SET - agent should stop now", session_id)
                     else:
                         # Agent not speaking - reset counter
-                        if consecutive_speech_during_agent > 0 and DEBUG_PRINT_VAD_DECISIONS:
-                            print(f"[{session_id}] ⚠️  Speech detected but agent_is_speaking=False (counter reset)")
+                        if consecutive_speech_during_agent > 0:
+                            log_overlap_reset()
                         consecutive_speech_during_agent = 0
                     
                     if not is_speaking:
-                        if DEBUG_PRINT_AUDIO_STATS:
-                            print(f"[{session_id}] 🎤 User speaking (energy: {energy:.4f})")
+                        log_speech_start(energy)
                         is_speaking = True
-                        speech_buffer_pcm.clear()
+                        speech_buffer_pcm.reset()
+                        loop.run_in_executor(stt.stt_executor, stt.start_stream, session_id)
                         speech_chunks = 0
                     
-                    speech_buffer_pcm.extend(current_chunk)
+                    feed_speech(current_chunk)
                     speech_chunks += 1
                     silent_chunks = 0
                 
                 elif is_speaking:
                     # Silence during speech
                     silent_chunks += 1
-                    speech_buffer_pcm.extend(current_chunk)
+                    feed_speech(current_chunk)
                     consecutive_speech_during_agent = 0
                     
                     if silent_chunks >= SILENT_CHUNKS_FOR_EOS:
-                        if DEBUG_PRINT_AUDIO_STATS:
-                            duration_ms = speech_chunks * MS_PER_VAD_CHUNK
-                            print(f"[{session_id}] 🛑 End of speech ({speech_chunks} chunks, {duration_ms:.0f}ms)")
+                        log_speech_end(speech_chunks)
                         is_speaking = False
                         
                         await process_speech_buffer(
                             speech_buffer_pcm, session_id, websocket, 
-                            transcript_queue, speech_chunks, MIN_SPEECH_CHUNKS
+                            transcript_queue, speech_chunks, MIN_SPEECH_CHUNKS, loop
                         )
                         
-                        speech_buffer_pcm.clear()
+                        speech_buffer_pcm.reset()
                         speech_chunks = 0
                         silent_chunks = 0
                 else:
                     # Silence while not speaking
                     consecutive_speech_during_agent = 0
                     silent_chunks = 0
+            
+            # Release the views so pcm16k_buffer can compact on the next extend()
+            for chunk in ready_chunks:
+                chunk.release()
+            emphasized_bytes.release()
+            ready_block.release()
 
     except WebSocketDisconnect:
-        print(f"[{session_id}] 🔌 Receiver disconnected")
+        logger.info("[%s] 🔌 Receiver disconnected", session_id)
     except asyncio.CancelledError:
-        print(f"[{session_id}] Receiver cancelled")
+        logger.info("[%s] Receiver cancelled", session_id)
     except Exception as e:
-        print(f"[{session_id}] ❌ Receiver error: {e}")
-        traceback.print_exc()
+        logger.exception("[%s] ❌ Receiver error: %s", session_id, e)
     finally:
-        await transcript_queue.put(None)
+        # Queued behind any pending stream calls so nothing re-opens it afterwards
+        stt.stt_executor.submit(stt.close_stream, session_id)
+        # End-of-call sentinel for agent_handler_task (hangups land here too).
+        # Never wait on a full queue: during teardown nothing drains it, and
+        # once this task returns the endpoint cancels the handler anyway
+        try:
+            transcript_queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
 
 
 async def process_speech_buffer(
-    speech_buffer: bytearray,
+    speech_buffer: UtteranceBuffer,
     session_id: str,
     websocket: WebSocket,
     transcript_queue: asyncio.Queue,
     speech_chunks: int,
-    min_chunks: int
+    min_chunks: int,
+    loop: asyncio.AbstractEventLoop
 ):
     """
-    Process accumulated speech buffer.
+    Finalize the utterance streamed to the STT worker.
     Validates minimum duration before transcription.
     """
     if speech_chunks < min_chunks:
         duration_ms = speech_chunks * MS_PER_VAD_CHUNK
         print(f"[{session_id}] ⏭️  Speech too short ({speech_chunks} chunks, {duration_ms:.0f}ms < {MIN_SPEECH_DURATION_MS}ms), ignoring")
+        loop.run_in_executor(stt.stt_executor, stt.discard_stream, session_id)
         return
     
     duration_ms = speech_chunks * MS_PER_VAD_CHUNK
@@ -445,16 +753,17 @@ async def process_speech_buffer(
         print(f"[{session_id}] 🎯 Transcribing {len(speech_buffer)} bytes ({speech_chunks} chunks, {duration_ms:.0f}ms)")
     
     # Log whisper input if enabled
-    save_audio_chunk(bytes(speech_buffer), session_id, "whisper_input")
+    with speech_buffer.view() as utterance:
+        save_audio_chunk(utterance, session_id, "whisper_input")
     
-    loop = asyncio.get_event_loop()
+    # Audio was already fed while the caller spoke; only decoding remains
     transcript = await loop.run_in_executor(
-        None, transcribe_audio, bytes(speech_buffer), "pcm16k"
+        stt.stt_executor, stt.finalize, session_id
     )
     
     if transcript.strip():
         print(f"[{session_id}] 📝 User: '{transcript}'")
-        await websocket.send_json({
+        await send_control(websocket, session_id, {
             "type": "transcript",
             "text": transcript
         })
@@ -475,11 +784,17 @@ async def websocket_vicidial(
     if ENABLE_AUDIO_LOGGING:
         print(f"[{session_id}] 🎙️  Audio logging ENABLED → {AUDIO_LOG_DIR.absolute()}")
     
+    binary_audio = websocket.query_params.get("proto") == "binary"
+    if binary_audio:
+        _binary_sessions.add(session_id)
+        print(f"[{session_id}] ⚡ Binary audio frames enabled")
+    
     caller_id = f"{websocket.client.host}:{websocket.client.port}"
     agent._get_buffer(session_id)["caller_id"] = caller_id
     
-    transcript_queue = asyncio.Queue()
-    audio_queue = asyncio.Queue()
+    # Bounded so TTS is paced by the sender instead of racing ahead of the network
+    transcript_queue = asyncio.Queue(maxsize=TRANSCRIPT_QUEUE_MAX)
+    audio_queue = AudioChunkRing(maxlen=AUDIO_QUEUE_MAX_CHUNKS)
     interruption_event = asyncio.Event()
     agent_is_speaking_event = asyncio.Event()
     
@@ -488,7 +803,7 @@ async def websocket_vicidial(
         sender_task = asyncio.create_task(
             audio_sender_task(
                 websocket, audio_queue, interruption_event,
-                agent_is_speaking_event, session_id
+                agent_is_speaking_event, session_id, binary_audio
             )
         )
         tasks.append(sender_task)
@@ -515,8 +830,7 @@ async def websocket_vicidial(
         done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
         
     except Exception as e:
-        print(f"[{session_id}] WebSocket error: {e}")
-        traceback.print_exc()
+        logger.exception("[%s] WebSocket error: %s", session_id, e)
     finally:
         for task in tasks:
             if not task.done():
@@ -525,7 +839,30 @@ async def websocket_vicidial(
         agent.end_call(session_id, "completed")
         
         # Clean up audio counters
-        if session_id in _audio_counters:
-            del _audio_counters[session_id]
+        for key in [key for key in _audio_counters if key[0] == session_id]:
+            del _audio_counters[key]
+        _binary_sessions.discard(session_id)
         
-        print(f"[{session_id}] Connection closed")
\ No newline at end of file
+        print(f"[{session_id}] Connection closed")
+
+
+@router.websocket("/ws/vicidial_ctrl/{session_id}")
+async def websocket_vicidial_control(websocket: WebSocket, session_id: str):
+    """
+    Control side channel for a media session.
+    Carries interrupts/transcripts on their own TCP connection.
+    """
+    await websocket.accept()
+    _control_sockets[session_id] = websocket
+    print(f"[{session_id}] 🎛️  Control channel connected")
+    
+    try:
+        while True:
+            # Downstream-only; read just to notice the disconnect
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if _control_sockets.get(session_id) is websocket:
+            del _control_sockets[session_id]
+        print(f"[{session_id}] Control channel closed")
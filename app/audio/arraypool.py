@@ -0,0 +1,41 @@
+import threading
+import numpy as np
+
+class Float32Pool:
+    """
+    Free-list of float32 arrays bucketed by power-of-two length.
+    acquire(n) may return a longer array than asked for; slice it.
+    Thread-safe, since STT and the event loop both hand arrays back.
+    """
+
+    def __init__(self, max_per_bucket: int = 4):
+        self.max_per_bucket = max_per_bucket
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(n: int) -> int:
+        """Smallest b with 2**b >= n."""
+        return max(1, n - 1).bit_length()
+
+    def acquire(self, n: int) -> np.ndarray:
+        """Get an uninitialized float32 array with at least n elements."""
+        bucket = self._bucket(n)
+        with self._lock:
+            free = self._buckets.get(bucket)
+            if free:
+                return free.pop()
+        return np.empty(1 << bucket, dtype=np.float32)
+
+    def release(self, array: np.ndarray) -> None:
+        """Return an array from acquire(); the caller must not use it afterwards."""
+        bucket = self._bucket(len(array))
+        if len(array) != 1 << bucket or array.base is not None:
+            return  # Not one of ours
+        with self._lock:
+            free = self._buckets.setdefault(bucket, [])
+            if len(free) < self.max_per_bucket:
+                free.append(array)
+
+# Shared by the STT paths (utterance buffers and one-shot transcriptions)
+float32_pool = Float32Pool()
@@ -0,0 +1,79 @@
+import numpy as np
+from app.config import PREEMPHASIS_ALPHA, VAD_CHUNK_SAMPLES
+
+# Optional: numba fuses the whole pass into one loop; vectorized numpy otherwise
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(cache=True, fastmath=True, nogil=True)
+    def _preemphasis_rms_kernel(src, dst, prev, alpha, frame_samples, energies):
+        """Pre-emphasis into dst and per-frame RMS (of dst / 32768) in one pass."""
+        for f in range(len(energies)):
+            acc = 0.0
+            for i in range(f * frame_samples, (f + 1) * frame_samples):
+                x = np.float32(src[i])
+                v = min(max(x - alpha * prev, -32768.0), 32767.0)
+                prev = x
+                y = np.int16(v)
+                dst[i] = y
+                acc += (y / 32768.0) ** 2
+            energies[f] = np.sqrt(acc / frame_samples)
+        return prev
+
+    @njit(cache=True, fastmath=True, nogil=True)
+    def _quantize_pcm16_kernel(src, dst):
+        """Scale float audio by 32767, clip and store as int16 in one pass."""
+        for i in range(len(src)):
+            dst[i] = np.int16(min(max(src[i] * 32767.0, -32767.0), 32767.0))
+else:
+    _preemphasis_rms_kernel = None
+    _quantize_pcm16_kernel = None
+
+def preemphasis_and_rms(src: np.ndarray, dst: np.ndarray, prev: float, alpha: float, frame_samples: int):
+    """
+    Pre-emphasize int16 samples into dst (y[n] = x[n] - alpha * x[n-1],
+    continuing from the previous block's last sample) and measure the
+    RMS energy of each frame_samples-long frame of the result.
+    len(src) must be a multiple of frame_samples.
+    Returns (energies, last input sample) so the next block can continue.
+    """
+    energies = np.empty(len(src) // frame_samples, dtype=np.float64)
+    if _preemphasis_rms_kernel is not None:
+        prev = _preemphasis_rms_kernel(src, dst, np.float32(prev), np.float32(alpha), frame_samples, energies)
+        return energies, float(prev)
+
+    x = src.astype(np.float32)
+    emphasized = np.empty_like(x)
+    emphasized[0] = x[0] - alpha * prev
+    np.multiply(x[:-1], -alpha, out=emphasized[1:])
+    emphasized[1:] += x[1:]
+    np.clip(emphasized, -32768, 32767, out=emphasized)
+    np.copyto(dst, emphasized, casting='unsafe')
+
+    normalized = dst.reshape(-1, frame_samples) / 32768.0
+    np.sqrt(np.mean(normalized * normalized, axis=1), out=energies)
+    return energies, float(x[-1])
+
+def float_to_pcm16(audio: np.ndarray) -> bytes:
+    """
+    Float audio in [-1.0, 1.0] (out-of-range samples are clipped) to 16-bit
+    PCM bytes, scaled by 32767. One pass and one int16 buffer.
+    """
+    out = np.empty(len(audio), dtype=np.int16)
+    if _quantize_pcm16_kernel is not None:
+        _quantize_pcm16_kernel(audio, out)
+        return out.tobytes()
+    
+    scaled = np.multiply(audio, 32767.0, dtype=np.float32)
+    np.clip(scaled, -32767.0, 32767.0, out=scaled)
+    np.copyto(out, scaled, casting='unsafe')
+    return out.tobytes()
+
+def warm_up():
+    """Trigger JIT compilation (or load it from cache) before the first call."""
+    src = np.zeros(VAD_CHUNK_SAMPLES, dtype=np.int16)
+    preemphasis_and_rms(src, np.empty_like(src), 0.0, PREEMPHASIS_ALPHA, VAD_CHUNK_SAMPLES)
+    float_to_pcm16(np.zeros(VAD_CHUNK_SAMPLES, dtype=np.float32))
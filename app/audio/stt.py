@@ -2,24 +2,122 @@ import io
 import traceback
 import numpy as np
 import soundfile as sf
-import scipy.signal
-import audioop
+import queue
+import threading
+from concurrent.futures import Executor, Future
 from pydub import AudioSegment
 from fastapi import HTTPException
-from app.config import WHISPER_GENERATION_KWARGS
+from app.config import WHISPER_GENERATION_KWARGS, WHISPER_MAX_BATCH, UTTERANCE_BUFFER_MAX_BYTES
+from app.audio.arraypool import float32_pool
+from app.audio.utils import resample_audio, ulaw_to_int16
 
 # This will be initialized in main.py and passed
 whisper_pipeline = None
 
+# Per-session float32 utterance buffer, taken from the array pool once per
+# call at the utterance cap and reused for every turn
+_stream_buffers = {}
+
+# Samples written so far for each session's open utterance
+_streams = {}
+
 def set_whisper_pipeline(pipeline):
     """Inject the loaded Whisper pipeline dependency."""
     global whisper_pipeline
     whisper_pipeline = pipeline
 
-def transcribe_audio(audio_bytes: bytes, source_format: str = "pcm16k") -> str:
+def _call_whisper(audio, **kwargs):
+    """Call the pipeline with config-based generation kwargs (minimal ones on TypeError)."""
+    try:
+        return whisper_pipeline(
+            audio,
+            return_timestamps=True,
+            generate_kwargs=WHISPER_GENERATION_KWARGS,
+            **kwargs
+        )
+    except TypeError as e:
+        # Fallback if generation_kwargs has issues
+        print(f"[STT] Generation kwargs error: {e}")
+        print(f"[STT] Retrying with minimal kwargs...")
+        return whisper_pipeline(
+            audio,
+            return_timestamps=True,
+            generate_kwargs={
+                "language": "english",
+                "task": "transcribe",
+                "temperature": 0.0
+            },
+            **kwargs
+        )
+
+def _run_whisper(audio_array: np.ndarray) -> str:
+    """Run Whisper on 16kHz float32 audio in [-1.0, 1.0]."""
+    transcript = _call_whisper(audio_array)["text"].strip()
+    
+    # Log if we got empty result
+    if not transcript:
+        print(f"[STT] Warning: Whisper returned empty transcript")
+        print(f"     Audio duration: {len(audio_array)/16000:.2f}s")
+        print(f"     Audio energy: {np.sqrt(np.mean(audio_array**2)):.4f}")
+    
+    return transcript
+
+def start_stream(session_id: str):
+    """Begin accumulating a new utterance for this session."""
+    if session_id not in _stream_buffers:
+        _stream_buffers[session_id] = float32_pool.acquire(UTTERANCE_BUFFER_MAX_BYTES // 2)
+    _streams[session_id] = 0
+
+def feed(session_id: str, pcm_bytes: bytes):
+    """Convert a pcm16k chunk straight into the session's utterance buffer."""
+    length = _streams.get(session_id)
+    if length is None:
+        return
+    audio = _stream_buffers[session_id]
+    samples = np.frombuffer(pcm_bytes, dtype=np.int16)[:len(audio) - length]
+    end = length + len(samples)
+    np.multiply(samples, 1.0 / 32768.0, out=audio[length:end], casting='unsafe')
+    _streams[session_id] = end
+
+def discard_stream(session_id: str):
+    """Drop the session's open utterance without transcribing it."""
+    _streams.pop(session_id, None)
+
+def close_stream(session_id: str):
+    """Drop the session's utterance and return its buffer to the pool at call end."""
+    _streams.pop(session_id, None)
+    audio = _stream_buffers.pop(session_id, None)
+    if audio is not None:
+        float32_pool.release(audio)
+
+def finalize(session_id: str) -> str:
+    """
+    Transcribe the session's utterance; its audio is already converted.
+    Submitted to stt_executor, it may be decoded in a batch with other calls'.
+    """
+    length = _streams.pop(session_id, None)
+    if not length:
+        return ""
+    
+    if whisper_pipeline is None:
+        print("[STT] STT model not initialized")
+        return ""
+    
+    try:
+        # View of the written samples; no concatenation copy
+        audio_array = _stream_buffers[session_id][:length]
+        print(f"[STT] Transcribing {len(audio_array) * 2} bytes of streamed pcm16k")
+        return _run_whisper(audio_array)
+    except Exception as e:
+        print(f"Transcription error: {e}")
+        traceback.print_exc()
+        return ""
+
+def transcribe_audio(audio_bytes: bytes | bytearray | memoryview, source_format: str = "pcm16k") -> str:
     """
     Transcribe audio to text.
-    Handles 'pcm16k' bytes directly for high accuracy.
+    Handles 'pcm16k' bytes directly for high accuracy; any buffer-protocol
+    object is read in place, so callers need not copy into bytes first.
     Handles 'mulaw' and 'wav' for the HTTP endpoint.
     Uses WHISPER_GENERATION_KWARGS from config for quality settings.
     """
@@ -33,77 +131,152 @@ def transcribe_audio(audio_bytes: bytes, source_format: str = "pcm16k") -> str:
             print(f"[STT] Transcribing {len(audio_bytes)} bytes of raw pcm16k")
             audio_array_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
             
-            # 2. Convert to float32 and normalize
+            # 2. Convert to float32 and normalize into a pooled array
             # Whisper expects audio in the range [-1.0, 1.0]
-            audio_array = audio_array_int16.astype(np.float32) / 32768.0
-            
-            sample_rate = 16000
+            n = len(audio_array_int16)
+            pooled = float32_pool.acquire(n)
+            try:
+                np.multiply(audio_array_int16, 1.0 / 32768.0, out=pooled[:n], casting='unsafe')
+                return _run_whisper(pooled[:n])
+            finally:
+                float32_pool.release(pooled)
             # --- END OF ACCURACY FIX ---
             
         else:
             # Fallback for HTTP endpoints (mulaw or webm/mp3/wav)
             print(f"[STT] Transcribing file with source_format: {source_format}")
             if source_format == "mulaw":
-                pcm_data = audioop.ulaw2lin(audio_bytes, 2)
-                audio = AudioSegment(data=pcm_data, sample_width=2, frame_rate=8000, channels=1)
+                # Table-lookup decode; resampled to 16kHz below. No pydub object or WAV round-trip
+                audio_array = ulaw_to_int16(audio_bytes).astype(np.float32)
+                sample_rate = 8000
+            elif source_format in ("wav", "flac"):
+                # soundfile decodes these itself, straight into float32
+                audio_array, sample_rate = sf.read(io.BytesIO(audio_bytes), dtype='float32')
+                if audio_array.ndim > 1:
+                    audio_array = audio_array.mean(axis=1, dtype=np.float32)
             else: # Assume webm, mp3, etc.
                 audio = AudioSegment.from_file(io.BytesIO(audio_bytes))
-            
-            # Resample to 16kHz, set to mono
-            audio = audio.set_frame_rate(16000).set_channels(1)
-            
-            # Export to WAV buffer for soundfile
-            wav_buffer = io.BytesIO()
-            audio.export(wav_buffer, format="wav")
-            wav_buffer.seek(0)
-            
-            # Read with soundfile and convert to float32
-            audio_array, sample_rate = sf.read(wav_buffer)
-            audio_array = audio_array.astype(np.float32)
+                
+                # Resample to 16kHz, set to mono, 16-bit
+                audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
+                
+                # Read the decoded PCM directly; no WAV export/re-read
+                audio_array = np.frombuffer(audio.raw_data, dtype=np.int16).astype(np.float32)
+                sample_rate = 16000
         
-        # Normalize (if not already done by pcm16k)
-        if source_format != "pcm16k":
-            max_val = np.abs(audio_array).max()
-            if max_val > 0:
-                audio_array = audio_array / max_val
+        # Peak-normalize in place (pcm16k returned above); max/min avoids an abs() temporary
+        max_val = max(audio_array.max(initial=0.0), -audio_array.min(initial=0.0))
+        if max_val > 0:
+            np.divide(audio_array, max_val, out=audio_array)
         
         if sample_rate != 16000:
-            print(f"[STT] Warning: Resampling from {sample_rate}Hz to 16000Hz")
-            num_samples = int(len(audio_array) * 16000 / sample_rate)
-            audio_array = scipy.signal.resample(audio_array, num_samples)
-        
-        # Run Whisper with config-based generation kwargs
-        try:
-            result = whisper_pipeline(
-                audio_array,
-                return_timestamps=True,
-                generate_kwargs=WHISPER_GENERATION_KWARGS
-            )
-        except TypeError as e:
-            # Fallback if generation_kwargs has issues
-            print(f"[STT] Generation kwargs error: {e}")
-            print(f"[STT] Retrying with minimal kwargs...")
-            result = whisper_pipeline(
-                audio_array,
-                return_timestamps=True,
-                generate_kwargs={
-                    "language": "english",
-                    "task": "transcribe",
-                    "temperature": 0.0
-                }
-            )
+            print(f"[STT] Resampling from {sample_rate}Hz to 16000Hz")
+            audio_array = resample_audio(audio_array, sample_rate, 16000)
         
-        transcript = result["text"].strip()
-        
-        # Log if we got empty result
-        if not transcript:
-            print(f"[STT] Warning: Whisper returned empty transcript")
-            print(f"     Audio duration: {len(audio_array)/16000:.2f}s")
-            print(f"     Audio energy: {np.sqrt(np.mean(audio_array**2)):.4f}")
-        
-        return transcript
+        return _run_whisper(audio_array)
         
     except Exception as e:
         print(f"Transcription error: {e}")
         traceback.print_exc()
-        return "" # Return empty string on error
\ No newline at end of file
+        return "" # Return empty string on error
+
+def _run_whisper_batch(audio_arrays: list) -> list:
+    """Run Whisper on several utterances in one batched pipeline call."""
+    results = _call_whisper(audio_arrays, batch_size=len(audio_arrays))
+    return [result["text"].strip() for result in results]
+
+# Calls that only touch one session's stream (session_id first); they may
+# run between a queued finalize and its batched decode unless they touch
+# one of the batched sessions
+_STREAM_CALLS = (start_stream, feed, discard_stream, close_stream)
+
+class WhisperWorker(Executor):
+    """
+    Dedicated Whisper thread fed by a FIFO queue, so stream calls for a
+    session run in submission order. finalize() calls that are queued
+    together are decoded in one batched pipeline call.
+    """
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="stt", daemon=True)
+        self._thread.start()
+    
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+    
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+    
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            try:
+                while True:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            
+            batch = []  # (future, session_id, length) awaiting one decode
+            for item in items:
+                if item is None:
+                    self._flush(batch)
+                    return
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                
+                if fn is finalize and not kwargs:
+                    batch.append((future, args[0], _streams.pop(args[0], None)))
+                    if len(batch) >= WHISPER_MAX_BATCH:
+                        self._flush(batch)
+                    continue
+                
+                # Decode first if this call could reuse a batched session's buffer
+                if batch and (fn not in _STREAM_CALLS or any(args[0] == entry[1] for entry in batch)):
+                    self._flush(batch)
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            self._flush(batch)
+    
+    def _flush(self, batch: list):
+        """Transcribe the queued finalize() utterances and resolve their futures."""
+        if not batch:
+            return
+        entries = [(future, session_id, length) for future, session_id, length in batch if length]
+        for future, _, length in batch:
+            if not length:
+                future.set_result("")
+        batch.clear()
+        if not entries:
+            return
+        
+        if whisper_pipeline is None:
+            print("[STT] STT model not initialized")
+            for future, _, _ in entries:
+                future.set_result("")
+            return
+        
+        # Views of the written samples; no concatenation copy
+        audio_arrays = [_stream_buffers[session_id][:length] for _, session_id, length in entries]
+        print(f"[STT] Transcribing {len(entries)} streamed utterance(s), {sum(map(len, audio_arrays)) * 2} bytes of pcm16k")
+        try:
+            if len(entries) == 1:
+                transcripts = [_run_whisper(audio_arrays[0])]
+            else:
+                transcripts = _run_whisper_batch(audio_arrays)
+        except Exception as e:
+            print(f"Transcription error: {e}")
+            traceback.print_exc()
+            transcripts = [""] * len(entries)
+        
+        for (future, _, _), transcript in zip(entries, transcripts):
+            future.set_result(transcript)
+
+# Single Whisper worker: stream calls for a session run in submission order
+stt_executor = WhisperWorker()
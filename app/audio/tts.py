@@ -1,10 +1,12 @@
-import io
 import inspect
+import struct
 import traceback
+from typing import Iterator
 import numpy as np
-import soundfile as sf
-import scipy.signal
+import torch
 from app.config import KOKORO_VOICE, KOKORO_LANG, TTS_SPEED, AGENT_SAMPLE_RATE
+from app.audio.utils import resample_audio, StreamingResampler
+from app.audio.preproc import float_to_pcm16
 
 # This will be initialized in main.py and passed
 tts_model = None
@@ -18,6 +20,7 @@ def _get_audio_array_from_tts_result(result):
     """Internal helper to extract audio array from Kokoro's varied outputs."""
     sample_rate = 24000  # Default Kokoro sample rate
     audio_array = None
+    owned = False  # True when audio_array is our own buffer, safe to modify in place
 
     if isinstance(result, tuple):
         audio_array, sample_rate = result
@@ -30,28 +33,17 @@ def _get_audio_array_from_tts_result(result):
             if chunk_obj is None:
                 continue
             
-            audio_data = None
-            if hasattr(chunk_obj, 'output') and hasattr(chunk_obj.output, 'audio'):
-                audio_data = chunk_obj.output.audio
-            elif hasattr(chunk_obj, 'audio'):
-                audio_data = chunk_obj.audio
-            elif isinstance(chunk_obj, (tuple, dict)):
-                audio_data, sr_chunk = _get_audio_array_from_tts_result(chunk_obj)
-                sample_rate = sr_chunk
-            else:
-                audio_data = chunk_obj
-
-            if audio_data is not None and not isinstance(audio_data, np.ndarray) and hasattr(audio_data, 'numpy'):
-                audio_data = audio_data.numpy()
-            
-            if audio_data is not None and isinstance(audio_data, np.ndarray):
-                if audio_data.size > 0:
-                    audio_chunks.append(audio_data)
+            audio_data, sample_rate = _get_audio_from_chunk(chunk_obj, sample_rate)
+            if audio_data is not None:
+                audio_chunks.append(audio_data)
         
-        if not audio_chunks:
-            audio_array = np.array([], dtype=np.float32)
-        else:
-            audio_array = np.concatenate(audio_chunks)
+        # One float32 allocation; each chunk is cast as it is copied in
+        audio_array = np.empty(sum(len(chunk) for chunk in audio_chunks), dtype=np.float32)
+        offset = 0
+        for chunk in audio_chunks:
+            audio_array[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        owned = True
     else:
         audio_array = result
 
@@ -63,10 +55,96 @@ def _get_audio_array_from_tts_result(result):
         audio_array = np.zeros(sample_rate, dtype=np.float32)
     
     if audio_array.dtype in [np.float32, np.float64]:
-        audio_array = np.clip(audio_array, -1.0, 1.0)
+        if owned:
+            np.clip(audio_array, -1.0, 1.0, out=audio_array)
+        else:
+            audio_array = np.clip(audio_array, -1.0, 1.0)
         
     return audio_array, sample_rate
 
+def _extract_output_audio(chunk_obj, sample_rate: int):
+    """KPipeline.Result: audio lives on .output (None for chunks without audio)."""
+    return getattr(chunk_obj.output, 'audio', None), sample_rate
+
+def _extract_audio_attr(chunk_obj, sample_rate: int):
+    return chunk_obj.audio, sample_rate
+
+def _extract_raw(chunk_obj, sample_rate: int):
+    return chunk_obj, sample_rate
+
+def _extract_nested(chunk_obj, sample_rate: int):
+    """Tuple/dict chunks carry their own sample rate."""
+    return _get_audio_array_from_tts_result(chunk_obj)
+
+def _pick_extractor(chunk_obj):
+    """Choose the extractor for a chunk type from a sample chunk."""
+    if hasattr(chunk_obj, 'output') and hasattr(chunk_obj.output, 'audio'):
+        return _extract_output_audio
+    if hasattr(chunk_obj, 'audio'):
+        return _extract_audio_attr
+    if isinstance(chunk_obj, (tuple, dict)):
+        return _extract_nested
+    return _extract_raw
+
+# Extractor per chunk type, resolved on the first chunk of each type so the
+# per-chunk path is one dict lookup instead of a chain of hasattr checks
+_chunk_extractors = {}
+
+def _get_audio_from_chunk(chunk_obj, sample_rate: int):
+    """
+    Extract the audio array from one Kokoro generator chunk.
+    Returns (audio_array or None if empty, sample_rate).
+    """
+    extract = _chunk_extractors.get(type(chunk_obj))
+    if extract is None:
+        extract = _chunk_extractors[type(chunk_obj)] = _pick_extractor(chunk_obj)
+    audio_data, sample_rate = extract(chunk_obj, sample_rate)
+
+    if isinstance(audio_data, torch.Tensor):
+        if audio_data.numel() == 0:
+            return None, sample_rate
+        audio_data = audio_data.cpu().numpy()
+    elif audio_data is not None and not isinstance(audio_data, np.ndarray) and hasattr(audio_data, 'numpy'):
+        audio_data = audio_data.numpy()
+    
+    if isinstance(audio_data, np.ndarray) and audio_data.size > 0:
+        return audio_data, sample_rate
+    return None, sample_rate
+
+def _to_pcm_bytes(audio_array: np.ndarray, sample_rate: int, target_rate: int) -> bytes:
+    """Resample float audio to target_rate and convert to 16-bit PCM bytes."""
+    if sample_rate != target_rate:
+        # Polyphase resampling (24k -> 16k is up=2, down=3)
+        audio_array = resample_audio(audio_array, sample_rate, target_rate)
+    return float_to_pcm16(audio_array)
+
+# RIFF/WAVE header for mono 16-bit PCM
+_WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+def _wrap_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wrap mono 16-bit PCM bytes in a 44-byte WAV header."""
+    header = _WAV_HEADER.pack(
+        b'RIFF', 36 + len(pcm), b'WAVE',
+        b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b'data', len(pcm)
+    )
+    return header + pcm
+
+# Zero PCM16 silence, sliced for fallbacks (60s at the highest rate we emit)
+_SILENCE_PCM = bytes(60 * 24000 * 2)
+
+def _fallback_audio(text: str, output_format: str) -> bytes:
+    """Silence roughly as long as the text, used when synthesis fails."""
+    sample_rate = AGENT_SAMPLE_RATE if output_format == "pcm16k" else (8000 if output_format == "pcm8k" else 24000)
+    duration = max(2.0, len(text.split()) * 0.5)
+    samples = int(duration * sample_rate)
+    
+    n_bytes = samples * 2
+    pcm = _SILENCE_PCM[:n_bytes] if n_bytes <= len(_SILENCE_PCM) else bytes(n_bytes)
+    if output_format in ["pcm8k", "pcm16k"]:
+        return pcm
+    return _wrap_wav(pcm, sample_rate)
+
 def synthesize_speech(text: str, output_format: str = "wav", voice: str = None) -> bytes:
     """
     Synchronous TTS synthesis.
@@ -86,58 +164,96 @@ def synthesize_speech(text: str, output_format: str = "wav", voice: str = None)
         
         # Generate pcm16k for relay to downsample
         if output_format == "pcm16k":
-            target_rate = AGENT_SAMPLE_RATE  # 16000 from config
-            if sample_rate != target_rate:
-                # High-quality scipy resampling for ONE-TIME conversion
-                num_samples = int(len(audio_array) * target_rate / sample_rate)
-                audio_array = scipy.signal.resample(audio_array, num_samples)
-                sample_rate = target_rate
-            
-            audio_array = np.clip(audio_array, -1.0, 1.0)
-            
-            # Convert to 16-bit PCM
-            pcm_data = (audio_array * 32767).astype(np.int16).tobytes()
+            pcm_data = _to_pcm_bytes(audio_array, sample_rate, AGENT_SAMPLE_RATE)
             
             print(f"[TTS] Generated pcm16k: {len(pcm_data)} bytes @ {AGENT_SAMPLE_RATE}Hz")
             return pcm_data
         
         # Legacy support for pcm8k (for HTTP endpoint if needed)
         elif output_format == "pcm8k":
-            target_rate = 8000
-            if sample_rate != target_rate:
-                num_samples = int(len(audio_array) * target_rate / sample_rate)
-                audio_array = scipy.signal.resample(audio_array, num_samples)
-            
-            pcm_data = (audio_array * 32767).astype(np.int16).tobytes()
+            pcm_data = _to_pcm_bytes(audio_array, sample_rate, 8000)
             print(f"[TTS] Generated pcm8k: {len(pcm_data)} bytes @ 8000Hz")
             return pcm_data
         
         else:  # Default to WAV
-            buffer = io.BytesIO()
-            sf.write(buffer, audio_array, sample_rate, format='WAV')
-            buffer.seek(0)
-            return buffer.read()
+            return _wrap_wav(float_to_pcm16(audio_array), sample_rate)
     
     except Exception as e:
         print(f"❌ TTS Error: {e}")
         traceback.print_exc()
         
         # Fallback silence
-        sample_rate = AGENT_SAMPLE_RATE if output_format == "pcm16k" else (8000 if output_format == "pcm8k" else 24000)
-        duration = max(2.0, len(text.split()) * 0.5)
-        samples = int(duration * sample_rate)
-        audio_array = np.zeros(samples, dtype=np.float32)
-        
-        if output_format in ["pcm8k", "pcm16k"]:
-            return (audio_array * 32767).astype(np.int16).tobytes()
-        else:
-            buffer = io.BytesIO()
-            sf.write(buffer, audio_array, sample_rate, format='WAV')
-            buffer.seek(0)
-            return buffer.read()
+        return _fallback_audio(text, output_format)
 
 def synthesize_speech_for_pipeline(text: str, output_format: str = "wav", voice: str = None) -> bytes:
     """
     Synchronous TTS synthesis wrapper for the streaming pipeline.
     """
-    return synthesize_speech(text, output_format=output_format, voice=voice)
\ No newline at end of file
+    return synthesize_speech(text, output_format=output_format, voice=voice)
+
+def synthesize_speech_stream(text: str, output_format: str = "pcm16k", voice: str = None) -> Iterator[bytes]:
+    """
+    Streaming TTS synthesis for the pipeline.
+    Yields PCM bytes for each Kokoro chunk as soon as it is generated,
+    instead of waiting for the whole utterance. Other formats yield once.
+    """
+    if output_format not in ("pcm16k", "pcm8k"):
+        yield synthesize_speech(text, output_format=output_format, voice=voice)
+        return
+    
+    if tts_model is None:
+        raise Exception("TTS model not initialized")
+    
+    if voice is None:
+        voice = KOKORO_VOICE
+    
+    target_rate = AGENT_SAMPLE_RATE if output_format == "pcm16k" else 8000
+    # One resampler for the whole sentence, so its history and phase carry
+    # across Kokoro chunks instead of restarting at each boundary
+    resampler = None
+    resampler_rate = None
+    produced = False
+    try:
+        result = tts_model(text, voice=voice, speed=TTS_SPEED)
+        if not inspect.isgenerator(result):
+            audio_array, sample_rate = _get_audio_array_from_tts_result(result)
+            yield _to_pcm_bytes(audio_array, sample_rate, target_rate)
+            return
+        
+        sample_rate = 24000  # Default Kokoro sample rate
+        for chunk_obj in result:
+            if chunk_obj is None:
+                continue
+            
+            audio_data, sample_rate = _get_audio_from_chunk(chunk_obj, sample_rate)
+            if audio_data is None:
+                continue
+            
+            produced = True
+            if sample_rate == target_rate:
+                yield float_to_pcm16(audio_data)
+                continue
+            
+            if sample_rate != resampler_rate:
+                if resampler is not None:
+                    yield float_to_pcm16(resampler.flush())
+                resampler = StreamingResampler(sample_rate, target_rate)
+                resampler_rate = sample_rate
+            
+            pcm = float_to_pcm16(resampler.process(audio_data))
+            if pcm:
+                yield pcm
+        
+        # The filter's last few outputs wait for input that never comes
+        if resampler is not None:
+            tail = float_to_pcm16(resampler.flush())
+            if tail:
+                yield tail
+    
+    except Exception as e:
+        print(f"❌ TTS Error: {e}")
+        traceback.print_exc()
+        
+        # Fallback silence, unless part of the sentence was already spoken
+        if not produced:
+            yield _fallback_audio(text, output_format)
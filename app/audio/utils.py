@@ -1,23 +1,140 @@
 import io
 import audioop
+import logging
+from functools import lru_cache
+from math import gcd
 import numpy as np
 import scipy.signal
-from pydub import AudioSegment
+from concurrent.futures import ProcessPoolExecutor
+from app.config import RESAMPLE_MIN_BATCH_BYTES, RESAMPLE_MAX_BATCH_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Optional: numba compiles the upsampling loop; numpy convolutions otherwise
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# 2x upsampling low-pass (cutoff at the 8kHz input's 4kHz Nyquist).
+# Gain of 2 restores the level lost to zero-stuffing; split into phases.
+_UPSAMPLE_FIR = (scipy.signal.firwin(32, 0.5) * 2).astype(np.float32)
+_UPSAMPLE_PHASES = (_UPSAMPLE_FIR[0::2].copy(), _UPSAMPLE_FIR[1::2].copy())
+
+def _build_ulaw_decode_table() -> np.ndarray:
+    """G.711 mu-law -> int16 for all 256 codes (same values as audioop.ulaw2lin)."""
+    u = ~np.arange(256, dtype=np.uint8)
+    magnitude = (((u & 0x0F).astype(np.int32) << 3) + 0x84) << ((u >> 4) & 0x07)
+    return np.where(u & 0x80, 0x84 - magnitude, magnitude - 0x84).astype(np.int16)
+
+_ULAW_DECODE_TABLE = _build_ulaw_decode_table()
+
+def ulaw_to_int16(mulaw_bytes) -> np.ndarray:
+    """Decode mu-law bytes with one vectorized table lookup."""
+    return _ULAW_DECODE_TABLE[np.frombuffer(mulaw_bytes, dtype=np.uint8)]
 
 def mulaw_to_pcm16k_bytes(mulaw_bytes: bytes) -> bytes:
     """
     (Batch) Convert 8kHz mulaw audio bytes to 16kHz 16-bit PCM audio bytes.
     - Used by the HTTP endpoint (stt.py)
     """
-    pcm_data = audioop.ulaw2lin(mulaw_bytes, 2)
-    audio_seg = AudioSegment(
-        data=pcm_data,
-        sample_width=2,
-        frame_rate=8000,
-        channels=1
-    )
-    audio_seg = audio_seg.set_frame_rate(16000)
-    return audio_seg.raw_data
+    # Table-lookup decode; ratecv reads the int16 array's buffer directly
+    pcm8k = ulaw_to_int16(mulaw_bytes)
+    pcm16k, _ = audioop.ratecv(pcm8k, 2, 1, 8000, 16000, None)
+    return pcm16k
+
+@lru_cache(maxsize=8)
+def _resample_filter(up: int, down: int) -> np.ndarray:
+    """
+    Anti-aliasing FIR for an up/down ratio, designed once instead of on
+    every resample_poly call (same design as scipy's default).
+    """
+    max_rate = max(up, down)
+    return scipy.signal.firwin(20 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+
+def resample_audio(audio: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """
+    Resample a float array between integer rates with a polyphase FIR
+    (O(N), unlike FFT resampling which degrades on awkward lengths).
+    """
+    if from_rate == to_rate:
+        return audio
+    g = gcd(from_rate, to_rate)
+    up, down = to_rate // g, from_rate // g
+    return scipy.signal.resample_poly(audio, up, down, window=_resample_filter(up, down))
+
+# Kokoro (24kHz) -> pcm16k / pcm8k, built at import
+_resample_filter(2, 3)
+_resample_filter(1, 3)
+
+
+class StreamingResampler:
+    """
+    Stateful polyphase resampler for a float stream that arrives in chunks.
+    Carries the input history and output phase across calls, so the chunks
+    come out as one continuous resample_audio of the whole stream: no
+    boundary transients, no per-chunk length rounding.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int):
+        g = gcd(from_rate, to_rate)
+        self.up, self.down = to_rate // g, from_rate // g
+        taps = _resample_filter(self.up, self.down) * self.up  # as resample_poly scales it
+        self.delay = (len(taps) - 1) // 2  # Output m is centred on upsampled sample m*down + delay
+        self.order = -(-len(taps) // self.up)  # Input samples per output
+        padded = np.zeros(self.order * self.up)
+        padded[:len(taps)] = taps
+        # phases[p][j] weights input sample (n // up - j) for upsampled position n with n % up == p
+        self.phases = padded.reshape(self.order, self.up).T.astype(np.float32)
+        self.reset()
+
+    def reset(self):
+        """Start a new stream (preceded by silence, like a fresh filter)."""
+        self.buffer = np.zeros(self.order - 1, dtype=np.float32)
+        self.start = 1 - self.order  # Stream index of buffer[0]
+        self.consumed = 0  # Stream samples fed so far
+        self.next_out = 0  # Index of the next output sample
+
+    def process(self, audio: np.ndarray) -> np.ndarray:
+        """Resample the next chunk; holds back the last few outputs for later."""
+        self.consumed += len(audio)
+        return self._emit(audio, None)
+
+    def flush(self) -> np.ndarray:
+        """Emit the held-back tail at the end of the stream and reset."""
+        total = -(-self.consumed * self.up // self.down)
+        last = (total - 1) * self.down + self.delay
+        pad = max(0, last // self.up + 1 - (self.start + len(self.buffer)))
+        out = self._emit(np.zeros(pad, dtype=np.float32), total)
+        self.reset()
+        return out
+
+    def _emit(self, audio: np.ndarray, limit) -> np.ndarray:
+        buf = np.concatenate((self.buffer, np.asarray(audio, dtype=np.float32)))
+        end = self.start + len(buf)
+        # Every output whose newest input sample has arrived
+        stop = max(self.next_out, -(-(self.up * end - self.delay) // self.down))
+        if limit is not None:
+            stop = max(self.next_out, min(stop, limit))
+
+        count = stop - self.next_out
+        out = np.zeros(count, dtype=np.float32)
+        # Outputs up apart share a phase and step down input samples
+        for i in range(min(self.up, count)):
+            n = (self.next_out + i) * self.down + self.delay
+            newest = n // self.up - self.start
+            acc = out[i::self.up]
+            span = self.down * (len(acc) - 1) + 1
+            for j, tap in enumerate(self.phases[n % self.up]):
+                acc += tap * buf[newest - j:newest - j + span:self.down]
+        self.next_out = stop
+
+        # Keep only the input the next output still reaches back to
+        oldest = (stop * self.down + self.delay) // self.up - (self.order - 1)
+        keep_from = min(max(oldest - self.start, 0), len(buf))
+        self.buffer = buf[keep_from:]
+        self.start += keep_from
+        return out
 
 def resample_pcm8k_to_pcm16k_scipy(pcm8k_bytes: bytes) -> bytes:
     """
@@ -30,8 +147,7 @@ def resample_pcm8k_to_pcm16k_scipy(pcm8k_bytes: bytes) -> bytes:
         audio_float32 = audio_int16.astype(np.float32) / 32768.0
         
         # 2. Resample (8k -> 16k means 2x the samples)
-        num_samples = len(audio_float32) * 2
-        resampled_float32 = scipy.signal.resample(audio_float32, num_samples)
+        resampled_float32 = resample_audio(audio_float32, 8000, 16000)
         
         # 3. Convert back to 16-bit pcm16k bytes
         resampled_float32 = np.clip(resampled_float32, -1.0, 1.0)
@@ -39,5 +155,130 @@ def resample_pcm8k_to_pcm16k_scipy(pcm8k_bytes: bytes) -> bytes:
         
         return resampled_int16.tobytes()
     except Exception as e:
-        print(f"[UTILS] scipy resampling error: {e}")
-        return b'' # Return empty bytes on error
\ No newline at end of file
+        logger.error("[UTILS] scipy resampling error: %s", e)
+        return b'' # Return empty bytes on error
+
+_resample_pools = []
+
+def get_resample_pool(max_workers: int, session_id: str) -> ProcessPoolExecutor:
+    """
+    Get the upsampling pool for a call. Lazily creates max_workers
+    single-process pools; a session always maps to the same one.
+    """
+    if not _resample_pools:
+        _resample_pools.extend(ProcessPoolExecutor(max_workers=1) for _ in range(max_workers))
+    return _resample_pools[hash(session_id) % len(_resample_pools)]
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _upsample2x_kernel(x, history, even_taps, odd_taps, out):
+        """Both FIR phases in one pass over history + x, written as int16."""
+        h = len(history)
+        taps = len(even_taps)
+        for i in range(len(x)):
+            acc_even = 0.0
+            acc_odd = 0.0
+            for k in range(taps):
+                j = i + taps - 1 - k
+                v = history[j] if j < h else np.float32(x[j - h])
+                acc_even += v * even_taps[k]
+                acc_odd += v * odd_taps[k]
+            out[2 * i] = np.int16(min(max(acc_even, -32768.0), 32767.0))
+            out[2 * i + 1] = np.int16(min(max(acc_odd, -32768.0), 32767.0))
+else:
+    _upsample2x_kernel = None
+
+def _upsample_into(x: np.ndarray, history: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    Polyphase FIR 2x upsampling of int16 samples x (after the carried input
+    history) into the int16 array out, len(out) == 2 * len(x).
+    Returns the new history.
+    """
+    even_taps, odd_taps = _UPSAMPLE_PHASES
+    if _upsample2x_kernel is not None:
+        _upsample2x_kernel(x, history, even_taps, odd_taps, out)
+        if len(x) >= len(history):
+            return x[len(x) - len(history):].astype(np.float32)
+        return np.concatenate((history[len(x):], x.astype(np.float32)))
+    
+    x_ext = np.concatenate((history, x.astype(np.float32)))
+    
+    # Each phase yields one output per input sample; interleave them
+    upsampled = np.empty(len(x) * 2, dtype=np.float32)
+    upsampled[0::2] = np.convolve(x_ext, even_taps, mode='valid')
+    upsampled[1::2] = np.convolve(x_ext, odd_taps, mode='valid')
+    
+    np.clip(upsampled, -32768, 32767, out=upsampled)
+    np.copyto(out, upsampled, casting='unsafe')
+    return x_ext[-len(history):].copy()
+
+def upsample_pcm8k_to_pcm16k(pcm8k_bytes, history: np.ndarray):
+    """
+    Polyphase FIR 2x upsampling of 8kHz PCM16 with carried input history.
+    Top-level and stateless so it can run in a worker process.
+    Returns (pcm16k_bytes, new_history).
+    """
+    x = np.frombuffer(pcm8k_bytes, dtype=np.int16)
+    if len(x) == 0:
+        return b'', history
+    
+    out = np.empty(len(x) * 2, dtype=np.int16)
+    new_history = _upsample_into(x, history, out)
+    return out.tobytes(), new_history
+
+
+class PCM8kTo16kUpsampler:
+    """
+    Stateful polyphase FIR upsampler for streaming 8kHz → 16kHz PCM16.
+    Carries the last (taps-1) input samples across calls so chunk
+    boundaries don't click.
+    """
+
+    def __init__(self):
+        self.history = np.zeros(len(_UPSAMPLE_PHASES[0]) - 1, dtype=np.float32)
+        # pcm8k waiting for the next pool dispatch
+        self.pending = bytearray()
+
+    def process(self, pcm8k_bytes) -> bytes:
+        """Upsample one chunk of 8kHz PCM16 bytes to 16kHz PCM16 bytes."""
+        pcm16k_bytes, self.history = upsample_pcm8k_to_pcm16k(pcm8k_bytes, self.history)
+        return pcm16k_bytes
+
+    def process_into(self, pcm8k_bytes, pcm_buffer) -> None:
+        """Like process(), but writes straight into a PCMByteBuffer's free space."""
+        x = np.frombuffer(pcm8k_bytes, dtype=np.int16)
+        n = len(x) * 4  # 2x the samples, 2 bytes each
+        if not n:
+            return
+        
+        tail = pcm_buffer.reserve(n)
+        out = np.frombuffer(tail, dtype=np.int16)
+        self.history = _upsample_into(x, self.history, out)
+        del out
+        tail.release()
+        pcm_buffer.commit(n)
+
+    async def process_in_pool(self, pcm8k_bytes, loop, pool) -> bytes:
+        """
+        Like process(), but in a worker process with adaptive batching:
+        once RESAMPLE_MIN_BATCH_BYTES are pending, everything buffered (up to
+        RESAMPLE_MAX_BATCH_BYTES) goes in one call. Returns b'' while filling.
+        Await calls in order so the carried history stays continuous.
+        """
+        self.pending.extend(pcm8k_bytes)
+        if len(self.pending) < RESAMPLE_MIN_BATCH_BYTES:
+            return b''
+        
+        size = min(len(self.pending), RESAMPLE_MAX_BATCH_BYTES) & ~1  # whole samples
+        batch = bytes(self.pending[:size])
+        del self.pending[:size]
+        
+        pcm16k_bytes, self.history = await loop.run_in_executor(
+            pool, upsample_pcm8k_to_pcm16k, batch, self.history
+        )
+        return pcm16k_bytes
+
+    def reset(self):
+        """Forget carried samples (e.g. after a stream discontinuity)."""
+        self.history = np.zeros_like(self.history)
+        self.pending.clear()
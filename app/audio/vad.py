@@ -1,28 +1,102 @@
+import copy
+import logging
+import threading
 import torch
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from app.config import (
     VAD_SAMPLE_RATE,
     VAD_CHUNK_SAMPLES,
     VAD_CHUNK_BYTES,
-    VAD_SPEECH_THRESHOLD
+    VAD_SPEECH_THRESHOLD,
+    SILENCE_PEAK_THRESHOLD,
+    VAD_WORKERS,
+    VAD_USE_ONNX
 )
 
+logger = logging.getLogger(__name__)
+
 # --- VAD Model Globals ---
 vad_model = None
 vad_utils = None
 
+def _init_vad_thread():
+    """Keep Torch single-threaded so concurrent sessions don't oversubscribe cores."""
+    torch.set_num_threads(1)
+
+# Single-thread shards: each serializes its Torch calls off the event loop,
+# and every call sticks to one shard (see get_vad_executor)
+vad_executors = [
+    ThreadPoolExecutor(
+        max_workers=1,
+        thread_name_prefix=f"vad{i}",
+        initializer=_init_vad_thread
+    )
+    for i in range(max(1, VAD_WORKERS))
+]
+
+def get_vad_executor(session_id: str) -> ThreadPoolExecutor:
+    """The VAD shard this session's chunks always run on."""
+    return vad_executors[hash(session_id) % len(vad_executors)]
+
+# Per-thread float32 input tensor (and model copy, when sharded)
+_thread_state = threading.local()
+
+def _thread_model():
+    """The VAD model for this thread; shards each get their own copy."""
+    if len(vad_executors) == 1:
+        return vad_model
+    if getattr(_thread_state, "model_source", None) is not vad_model:
+        if _is_onnx_model(vad_model):
+            # An ONNX Runtime session can't be deep-copied; load another
+            # from the local hub cache
+            _thread_state.model = _load_silero(onnx=True)[0]
+        else:
+            _thread_state.model = copy.deepcopy(vad_model)
+        _thread_state.model_source = vad_model
+    return _thread_state.model
+
+def _scratch():
+    """
+    Get this thread's persistent (VAD_CHUNK_SAMPLES,) float32 input as a
+    (numpy array, tensor) pair sharing one buffer.
+    """
+    scratch = getattr(_thread_state, "scratch", None)
+    if scratch is None:
+        array = np.empty(VAD_CHUNK_SAMPLES, dtype=np.float32)
+        scratch = (array, torch.from_numpy(array))
+        _thread_state.scratch = scratch
+    return scratch
+
+def _load_silero(onnx: bool):
+    """Load Silero VAD from torch.hub (ONNX Runtime or TorchScript)."""
+    return torch.hub.load(
+        repo_or_dir='snakers4/silero-vad',
+        model='silero_vad',
+        force_reload=False,
+        onnx=onnx
+    )
+
+def _is_onnx_model(model) -> bool:
+    """True for Silero's ONNX Runtime wrapper (it holds an InferenceSession)."""
+    return hasattr(model, "session")
+
 def create_vad_model():
     """
     Load the Silero VAD model from torch.hub.
     This will download the model on first run.
+    Uses ONNX Runtime when VAD_USE_ONNX is set and onnxruntime is available.
     """
     try:
-        model, utils = torch.hub.load(
-            repo_or_dir='snakers4/silero-vad',
-            model='silero_vad',
-            force_reload=False,
-            onnx=False
-        )
+        model = utils = None
+        if VAD_USE_ONNX:
+            try:
+                model, utils = _load_silero(onnx=True)
+            except Exception as e:
+                print(f"⚠️ ONNX Silero VAD unavailable ({e}), using TorchScript")
+        if model is None:
+            model, utils = _load_silero(onnx=False)
         
         # Unpack utils
         (get_speech_timestamps,
@@ -42,7 +116,7 @@ def create_vad_model():
             "collect_chunks": collect_chunks
         }
         
-        print(f"✅ Silero VAD model loaded")
+        print(f"✅ Silero VAD model loaded ({'ONNX Runtime' if _is_onnx_model(model) else 'TorchScript'})")
         print(f"   Sample rate: {VAD_SAMPLE_RATE}Hz")
         print(f"   Chunk size: {VAD_CHUNK_SAMPLES} samples ({VAD_CHUNK_BYTES} bytes)")
         print(f"   Speech threshold: {VAD_SPEECH_THRESHOLD}")
@@ -63,38 +137,61 @@ def get_vad_model():
     """Get the loaded VAD model and utils."""
     return vad_model, vad_utils
 
+def warm_up_vad():
+    """
+    Run one forward pass on the VAD thread so its Torch thread setup and
+    the model's first-call JIT cost are paid at startup, not mid-call.
+    Run once on each of vad_executors.
+    """
+    if vad_model is None:
+        return
+    with torch.inference_mode():
+        model = _thread_model()
+        model(torch.zeros(VAD_CHUNK_SAMPLES, dtype=torch.float32), VAD_SAMPLE_RATE)
+    if hasattr(model, "reset_states"):
+        model.reset_states()
+
+def _is_trivially_silent(samples: np.ndarray) -> bool:
+    """Peak gate: True when no int16 sample reaches SILENCE_PEAK_THRESHOLD."""
+    return samples.max() < SILENCE_PEAK_THRESHOLD and samples.min() > -SILENCE_PEAK_THRESHOLD
+
 def is_chunk_speech(pcm_chunk: bytes) -> bool:
     """
     Check if a 16kHz PCM audio chunk contains speech.
     Uses VAD_SPEECH_THRESHOLD from config.
     
     Args:
-        pcm_chunk: Bytes of 16-bit 16kHz mono PCM audio.
+        pcm_chunk: Bytes (or memoryview) of 16-bit 16kHz mono PCM audio.
                    MUST be exactly VAD_CHUNK_BYTES long.
     
     Returns:
         True if speech is detected, False otherwise.
     """
     if vad_model is None:
-        print("VAD model not loaded, assuming no speech.")
+        logger.debug("VAD model not loaded, assuming no speech.")
         return False
         
     if len(pcm_chunk) != VAD_CHUNK_BYTES:
         # Pad or truncate to expected size
         if len(pcm_chunk) < VAD_CHUNK_BYTES:
             padding = bytes(VAD_CHUNK_BYTES - len(pcm_chunk))
-            pcm_chunk += padding
+            pcm_chunk = bytes(pcm_chunk) + padding
         else:
             pcm_chunk = pcm_chunk[:VAD_CHUNK_BYTES]
         
     try:
-        # 1. Convert bytes to float32 tensor
-        audio_int16 = np.frombuffer(pcm_chunk, dtype=np.int16)
-        audio_float32 = audio_int16.astype(np.float32) / 32768.0
-        audio_tensor = torch.from_numpy(audio_float32)
+        # 0. Skip the model for chunks that are plainly silent
+        samples = np.frombuffer(pcm_chunk, dtype=np.int16)
+        if _is_trivially_silent(samples):
+            return False
+        
+        # 1. Convert and scale to float32 in one pass into the reusable scratch
+        audio_array, audio_tensor = _scratch()
+        np.multiply(samples, 1.0 / 32768.0, out=audio_array, casting='unsafe')
         
         # 2. Get speech probability from model
-        speech_prob = vad_model(audio_tensor, VAD_SAMPLE_RATE).item()
+        with torch.inference_mode():
+            speech_prob = _thread_model()(audio_tensor, VAD_SAMPLE_RATE).item()
         
         # 3. Compare against configured threshold
         return speech_prob > VAD_SPEECH_THRESHOLD
@@ -102,9 +199,18 @@ def is_chunk_speech(pcm_chunk: bytes) -> bool:
     except Exception as e:
         # Catch the specific error about chunk size
         if "Provided number of samples is" in str(e):
-            print(f"FATAL VAD ERROR: {e}")
-            print(f"Expected {VAD_CHUNK_SAMPLES} samples, got {len(pcm_chunk)//2}")
-            print(f"Check VAD_CHUNK_SAMPLES in config.py")
+            logger.error(
+                "FATAL VAD ERROR: %s (expected %d samples, got %d; check VAD_CHUNK_SAMPLES in config.py)",
+                e, VAD_CHUNK_SAMPLES, len(pcm_chunk) // 2
+            )
         else:
-            print(f"Error during VAD processing: {e}")
-        return False
\ No newline at end of file
+            logger.error("Error during VAD processing: %s", e)
+        return False
+
+def is_chunks_speech(pcm_chunks: List[bytes]) -> List[bool]:
+    """
+    is_chunk_speech over consecutive chunks of one stream, in order.
+    Silero is stateful: each call carries its context into the next, so a
+    stream's frames go through the model one at a time, never as batch rows.
+    """
+    return [is_chunk_speech(chunk) for chunk in pcm_chunks]
@@ -12,6 +12,15 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 LLM_MODEL = "gemini-flash-lite-latest"
 LLM_TEMPERATURE = 0.7
 LLM_MAX_HISTORY = 6  # Keep last N messages in context
+STATE_MAX_MESSAGES = 20  # Messages retained per session in the graph state
+
+# --- LLM Semantic Cache ---
+# Serves near-duplicate prompts from Redis instead of calling Gemini.
+# Only turns without patient data are eligible (see agent/nodes.py).
+LLM_SEMANTIC_CACHE = os.getenv("LLM_SEMANTIC_CACHE", "false").lower() == "true"
+LLM_CACHE_DISTANCE_THRESHOLD = 0.1  # Lower = stricter match
+LLM_CACHE_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # Small, CPU-friendly
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 
 # --- VAD Configuration ---
 # Balance between responsiveness and false positives
@@ -26,6 +35,10 @@ VAD_SILENCE_TIMEOUT_MS = 1500  # 1.5 seconds (increased from 1000ms)
 # VAD_SPEECH_THRESHOLD = 0.45  # Decreased from 0.5
 VAD_SPEECH_THRESHOLD = float(os.getenv("VAD_SPEECH_THRESHOLD", 0.45))
 
+# Peak gate in front of Silero: chunks whose |sample| never reaches this
+# are treated as silence without running the model (400 ≈ -38 dBFS)
+SILENCE_PEAK_THRESHOLD = 400
+
 # Minimum speech duration before triggering barge-in
 # Prevents accidental mouth noises from interrupting
 MIN_BARGEIN_SPEECH_MS = 400  # 400ms (3 consecutive speech chunks)
@@ -57,6 +70,10 @@ WHISPER_GENERATION_KWARGS = {
     "compression_ratio_threshold": 2.4  # Reject repetitive/garbled output
 }
 
+# Utterances from different calls that finish together are decoded in one
+# batched Whisper call, up to this many at a time
+WHISPER_MAX_BATCH = 4
+
 # --- TTS Configuration ---
 KOKORO_VOICE = "af_bella"  # Clear, professional voice
 KOKORO_LANG = "a"      # English
@@ -73,6 +90,9 @@ AUDIO_LOG_DIR = Path("./audio_logs")
 DEBUG_PRINT_AUDIO_STATS = True   # Print energy/duration for each chunk
 DEBUG_PRINT_VAD_DECISIONS = True  # Print every VAD decision (very verbose!)
 
+# Logging level for modules using the logging package (DEBUG shows per-chunk VAD detail)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
 # --- Asterisk/Telephony Configuration ---
 # These should match your Asterisk codec settings
 ASTERISK_SAMPLE_RATE = 8000
@@ -84,10 +104,33 @@ AGENT_SAMPLE_RATE = 16000  # Backend processes at 16kHz
 VAD_SAMPLE_RATE = 16000    # Silero VAD expects 16kHz
 VAD_CHUNK_SAMPLES = 512    # Silero VAD chunk size for 16kHz
 
+# Per-call inbound PCM buffer feeding VAD (allocated once, reused in place)
+PCM_BUFFER_CAPACITY = 64 * 1024
+
+# Per-call utterance buffer: allocated once, doubles as needed up to the cap
+UTTERANCE_BUFFER_INITIAL_BYTES = 64 * 1024
+UTTERANCE_BUFFER_MAX_BYTES = 2 * 1024 * 1024  # ~65s of 16kHz PCM16
+
 # --- Performance ---
 # Thread pool size for blocking operations (STT, TTS)
 EXECUTOR_MAX_WORKERS = 4
 
+# 8kHz → 16kHz upsampling of caller audio. 0 runs it inline (two short
+# convolutions per 20ms chunk); N > 0 moves it to N single-process pools,
+# each call pinned to one of them by session id
+RESAMPLE_WORKERS = int(os.getenv("RESAMPLE_WORKERS", 0))
+# Pool dispatches take whatever is buffered between these bounds (pcm8k bytes)
+RESAMPLE_MIN_BATCH_BYTES = 640   # 40ms
+RESAMPLE_MAX_BATCH_BYTES = 4000  # 250ms
+
+# Silero VAD runs on N single-thread shards, each with its own model copy;
+# a call always lands on the same shard (keyed by session id)
+VAD_WORKERS = int(os.getenv("VAD_WORKERS", 1))
+
+# Run Silero VAD on ONNX Runtime (single-threaded CPU session) instead of
+# TorchScript; falls back to TorchScript if onnxruntime is not installed
+VAD_USE_ONNX = os.getenv("VAD_USE_ONNX", "true").lower() == "true"
+
 # --- Network/WebSocket ---
 # WebSocket ping interval (keep connection alive)
 WS_PING_INTERVAL = 20  # seconds
@@ -96,8 +139,26 @@ WS_PING_INTERVAL = 20  # seconds
 # These help with network jitter and ensure responsive behavior
 AUDIO_CHUNK_TIMEOUT = 0.02  # 20ms - matches Asterisk pacing
 AUDIO_QUEUE_CHECK_INTERVAL = 0.02  # Check interruption every 20ms
+
+# Outgoing audio: merge small queued chunks into one frame, bounded so
+# an interrupt never waits behind more than ~100ms of audio
+AUDIO_COALESCE_BYTES = 3200  # 100ms @ 16kHz PCM16
+AUDIO_COALESCE_MAX_ITEMS = 5
+AUDIO_COALESCE_LINGER_MS = 20  # Max wait for more audio when a small chunk is short of the target
 VAD_PROCESSING_TIMEOUT = 0.1  # Max time to process one VAD chunk
 
+# Per-call queue bounds: a full queue blocks its producer (backpressure)
+# instead of buffering without limit. An interrupt clears the audio queue,
+# so its size bounds memory, not barge-in latency.
+AUDIO_QUEUE_MAX_CHUNKS = 16  # TTS chunks waiting for the sender (one Kokoro segment each)
+SENTENCE_QUEUE_MAX = 32  # LLM sentences waiting for TTS
+TRANSCRIPT_QUEUE_MAX = 8  # Finished utterances waiting for the agent
+
+# --- Conversation State (LangGraph checkpointer) ---
+# "memory" keeps state in-process; "redis" shares it across workers and restarts
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "memory")
+REDIS_MAX_CONNECTIONS = 32
+
 # --- Database ---
 DATABASE_PATH = "medicare_calls.db"
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./medicare_agent.db")
@@ -1,4 +1,7 @@
 import os
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
 import uvicorn
 import torch
 from fastapi import FastAPI
@@ -19,14 +22,25 @@ from app.config import (
     VAD_SPEECH_THRESHOLD,
     VAD_SILENCE_TIMEOUT_MS,
     MIN_SPEECH_DURATION_MS,
-    MIN_BARGEIN_SPEECH_MS
+    MIN_BARGEIN_SPEECH_MS,
+    LOG_LEVEL
 )
 from app.database import init_db
+from app.agent.nodes import init_llm_cache, warm_up_model
 from app.api import http, websocket
-from app.audio import stt, tts, vad
+from app.audio import preproc, stt, tts, vad
 from app.streaming.manager import MedicareAgent
 from app.streaming.pipeline import set_agent_manager as set_pipeline_agent_manager
 
+# Log records go through a queue to a background thread, so the
+# event loop never blocks on stderr writes (e.g. exception tracebacks)
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+logging.basicConfig(level=LOG_LEVEL, handlers=[QueueHandler(_log_queue)])
+log_listener = QueueListener(_log_queue, _log_handler, respect_handler_level=True)
+log_listener.start()
+
 # --- Global Variables ---
 app = FastAPI(title="Medicare AI Voice Agent", version="2.0.0-config-integrated")
 agent_manager = MedicareAgent()
@@ -83,8 +97,17 @@ def load_models():
     # 3. Load Silero VAD
     try:
         vad.create_vad_model() # This loads and sets the model internally
+        for executor in vad.vad_executors:
+            executor.submit(vad.warm_up_vad).result()
+        preproc.warm_up()
     except Exception as e:
         print(f"❌ Failed to load Silero VAD: {e}")
+    
+    # 4. Build the Gemini client and tool schemas
+    try:
+        warm_up_model()
+    except Exception as e:
+        print(f"❌ Failed to initialize LLM client: {e}")
         
     print("✅ All models loaded successfully\n")
 
@@ -105,6 +128,11 @@ async def startup_event():
     load_models()
     init_db()
     
+    try:
+        init_llm_cache()
+    except Exception as e:
+        print(f"❌ Failed to enable LLM semantic cache: {e}")
+    
     # Inject dependencies
     http.set_agent_manager(agent_manager)
     set_pipeline_agent_manager(agent_manager)
@@ -113,6 +141,12 @@ async def startup_event():
     print("✅ Startup complete - Ready to accept calls")
     print("="*60 + "\n")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the Whisper worker and flush queued log records before exit."""
+    stt.stt_executor.shutdown(wait=False)
+    log_listener.stop()
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
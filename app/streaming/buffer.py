@@ -1,4 +1,7 @@
+import asyncio
+from collections import deque
 from typing import Optional
+from app.config import PCM_BUFFER_CAPACITY, UTTERANCE_BUFFER_INITIAL_BYTES, UTTERANCE_BUFFER_MAX_BYTES
 
 class SentenceBuffer:
     """
@@ -77,3 +80,173 @@ class SentenceBuffer:
     def has_content(self) -> bool:
         """Check if buffer has any content"""
         return bool(self.buffer.strip())
+
+
+class PCMByteBuffer:
+    """
+    Pre-sized ring-style byte buffer for slicing fixed-size PCM frames.
+    Reads advance read_idx and writes advance write_idx; when a write would
+    run past the end, the unread tail is moved to offset 0 instead of
+    reallocating. take() and reserve() return zero-copy memoryviews;
+    release them before the next extend()/reserve(), which may move or
+    overwrite that memory.
+    """
+
+    def __init__(self, capacity: int = PCM_BUFFER_CAPACITY):
+        self.buf = bytearray(capacity)
+        self.read_idx = 0
+        self.write_idx = 0
+
+    def _make_room(self, n: int) -> None:
+        """Ensure n writable bytes after write_idx, compacting (and only if unavoidable, growing) in place."""
+        if self.read_idx == self.write_idx:
+            self.read_idx = self.write_idx = 0
+        
+        if self.write_idx + n > len(self.buf):
+            unread = self.write_idx - self.read_idx
+            self.buf[:unread] = self.buf[self.read_idx:self.write_idx]
+            self.read_idx, self.write_idx = 0, unread
+            if unread + n > len(self.buf):
+                self.buf.extend(bytes(max(len(self.buf), unread + n - len(self.buf))))
+
+    def extend(self, chunk) -> None:
+        """Append audio."""
+        n = len(chunk)
+        self._make_room(n)
+        self.buf[self.write_idx:self.write_idx + n] = chunk
+        self.write_idx += n
+
+    def reserve(self, n: int) -> memoryview:
+        """
+        Writable view of the next n free bytes, so a producer can write in
+        place; call commit(n) after releasing it.
+        """
+        self._make_room(n)
+        return memoryview(self.buf)[self.write_idx:self.write_idx + n]
+
+    def commit(self, n: int) -> None:
+        """Mark n bytes written through reserve() as readable."""
+        self.write_idx += n
+
+    def available(self) -> int:
+        """Number of unread bytes."""
+        return self.write_idx - self.read_idx
+
+    def take(self, n: int) -> memoryview:
+        """Consume n bytes and return them as a view into the buffer."""
+        view = memoryview(self.buf)[self.read_idx:self.read_idx + n]
+        self.read_idx += n
+        return view
+
+    def clear(self) -> None:
+        """Drop all buffered audio (capacity is kept)."""
+        self.read_idx = self.write_idx = 0
+
+
+class UtteranceBuffer:
+    """
+    Pre-sized byte buffer for one utterance at a time.
+    reset() only rewinds the length, so capacity survives between turns.
+    With store=False only the length (and cap) is tracked; nothing is
+    allocated or copied and view() is empty.
+    """
+
+    def __init__(self, initial_bytes: int = UTTERANCE_BUFFER_INITIAL_BYTES, max_bytes: int = UTTERANCE_BUFFER_MAX_BYTES, store: bool = True):
+        self.buf = bytearray(initial_bytes if store else 0)
+        self.length = 0
+        self.max_bytes = max_bytes
+        self.store = store
+
+    def __len__(self) -> int:
+        return self.length
+
+    def extend(self, data) -> int:
+        """Append data, doubling capacity up to max_bytes. Returns bytes written."""
+        if not self.store:
+            written = min(len(data), self.max_bytes - self.length)
+            self.length += written
+            return written
+        
+        end = self.length + len(data)
+        if end > len(self.buf):
+            new_size = min(max(end, len(self.buf) * 2), self.max_bytes)
+            self.buf.extend(bytes(new_size - len(self.buf)))
+        
+        written = min(len(data), len(self.buf) - self.length)
+        if written:
+            self.buf[self.length:self.length + written] = memoryview(data)[:written]
+            self.length += written
+        return written
+
+    def view(self) -> memoryview:
+        """Zero-copy view of the current utterance; release before extend()."""
+        return memoryview(self.buf)[:self.length]
+
+    def reset(self) -> None:
+        """Start a new utterance, keeping the allocated capacity."""
+        self.length = 0
+
+
+class AudioChunkRing:
+    """
+    Bounded single-producer/single-consumer queue for audio chunks.
+    A deque plus two events, without asyncio.Queue's waiter lists and
+    unfinished-task bookkeeping. Offers the subset of the Queue API the
+    pipeline uses; task_done() is a no-op kept for compatibility.
+    """
+
+    def __init__(self, maxlen: int = 64):
+        self.maxlen = maxlen
+        self._items = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def full(self) -> bool:
+        return len(self._items) >= self.maxlen
+
+    async def put(self, item) -> None:
+        """Append an item, waiting while the ring is full."""
+        while len(self._items) >= self.maxlen:
+            self._writable.clear()
+            await self._writable.wait()
+        self.put_nowait(item)
+
+    def put_nowait(self, item) -> None:
+        if len(self._items) >= self.maxlen:
+            raise asyncio.QueueFull
+        self._items.append(item)
+        self._readable.set()
+
+    async def get(self):
+        """Pop the oldest item, waiting until one is available."""
+        while not self._items:
+            self._readable.clear()
+            await self._readable.wait()
+        return self.get_nowait()
+
+    def get_nowait(self):
+        if not self._items:
+            raise asyncio.QueueEmpty
+        item = self._items.popleft()
+        if not self._items:
+            self._readable.clear()
+        self._writable.set()
+        return item
+
+    def task_done(self) -> None:
+        pass
+
+    def clear(self) -> int:
+        """Drop all pending items and return how many."""
+        dropped = len(self._items)
+        self._items.clear()
+        self._readable.clear()
+        self._writable.set()
+        return dropped
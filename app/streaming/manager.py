@@ -1,10 +1,11 @@
+import asyncio
 import json
 from datetime import datetime
 from typing import AsyncGenerator
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import HumanMessage, ToolMessage
 from app.agent.graph import create_agent_graph
 from app.agent.state import PatientInfoExtraction
-from app.agent.nodes import tool_node, agent_node
+from app.agent.nodes import tool_node
 from app.agent.prompts import build_system_prompt
 from app.agent.tools import update_patient_info, end_call, forward_call_to_human
 from app.streaming.pipeline import agent_node_streaming
@@ -19,6 +20,14 @@ class MedicareAgent:
         # In-memory buffer for active calls
         self._call_buffers = {}
 
+    async def prewarm_session(self, session_id: str):
+        """
+        Load the session's checkpoint off the critical path (e.g. while STT runs).
+        The caller hands the snapshot to process_message_streaming for the same turn.
+        """
+        config = {"configurable": {"thread_id": session_id}}
+        return await asyncio.to_thread(self.app.get_state, config)
+
     def _get_buffer(self, session_id: str, caller_id: str = None):
         """Get or create an in-memory buffer for a session."""
         if session_id not in self._call_buffers:
@@ -37,11 +46,13 @@ class MedicareAgent:
     async def process_message_streaming(
         self,
         session_id: str,
-        user_message: str
+        user_message: str,
+        state=None
     ) -> AsyncGenerator[dict, None]:
         """
         Process user message with streaming support.
         Yields sentences as they're generated from the LLM.
+        state is an optional checkpoint snapshot from prewarm_session.
         """
         config = {"configurable": {"thread_id": session_id}}
         buffer = self._get_buffer(session_id)
@@ -54,7 +65,7 @@ class MedicareAgent:
             input_data = {"messages": []} # For greeting
 
         # Get current state from LangGraph's checkpointer
-        current_state = self.app.get_state(config)
+        current_state = state or self.app.get_state(config)
         current_messages = current_state.values.get("messages", [])
         current_patient_info = current_state.values.get("patient_info", PatientInfoExtraction())
         
@@ -91,9 +102,9 @@ class MedicareAgent:
                 self.app.update_state(config, update_data)
                 
         # Handle tool calls AFTER streaming, if any
-        if final_message_obj and isinstance(final_message_obj, AIMessage) and final_message_obj.tool_calls:
+        if getattr(final_message_obj, "tool_calls", None):
             tool_state = self.app.get_state(config)
-            tool_result = tool_node(tool_state.values)
+            tool_result = await tool_node(tool_state.values)
             
             # Update buffer with new patient info from tool
             if "patient_info" in tool_result:
@@ -107,14 +118,19 @@ class MedicareAgent:
             
             if tool_name == "update_patient_info":
                 follow_up_state = self.app.get_state(config)
-                follow_up_result = agent_node(follow_up_state.values)
+                follow_up_response = ""
                 
-                self.app.update_state(config, follow_up_result)
+                # Stream the follow-up as well so its first sentence reaches TTS early
+                async for chunk in agent_node_streaming(follow_up_state.values):
+                    if chunk.get("type") == "sentence":
+                        follow_up_response += chunk["sentence"] + " "
+                        yield {"sentence": chunk["sentence"]}
+                    
+                    elif chunk.get("type") == "final":
+                        self.app.update_state(config, {"messages": chunk["messages"]})
                 
-                follow_up_message = follow_up_result["messages"][0]
-                if isinstance(follow_up_message, AIMessage) and follow_up_message.content:
-                    buffer["turns"].append({"role": "agent", "content": follow_up_message.content, "timestamp": datetime.utcnow()})
-                    yield {"sentence": follow_up_message.content}
+                if follow_up_response.strip():
+                    buffer["turns"].append({"role": "agent", "content": follow_up_response.strip(), "timestamp": datetime.utcnow()})
 
         yield {"final": True}
         return
@@ -1,14 +1,14 @@
 import asyncio
-import traceback
+import logging
 from typing import AsyncGenerator
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import AIMessage
-from app.config import GOOGLE_API_KEY
 from app.agent.state import InterviewState, PatientInfoExtraction
-from app.agent.prompts import build_system_prompt
-from app.agent.tools import update_patient_info, end_call, forward_call_to_human
-from app.streaming.buffer import SentenceBuffer
-from app.audio.tts import synthesize_speech_for_pipeline
+from app.agent.prompts import build_prompt_messages
+from app.agent.nodes import get_model, is_cacheable_turn, scripted_response
+from app.streaming.buffer import AudioChunkRing, SentenceBuffer
+from app.audio.tts import synthesize_speech_stream
+
+logger = logging.getLogger(__name__)
 
 # This will be initialized in main.py
 agent_manager = None
@@ -19,29 +19,41 @@ def set_agent_manager(manager):
     agent_manager = manager
 
 # ===== PHASE 1: STREAMING AGENT NODE =====
+async def _as_single_chunk(awaitable):
+    """Adapt a single awaited response to the astream() interface."""
+    yield await awaitable
+
 async def agent_node_streaming(state: InterviewState) -> AsyncGenerator[dict, None]:
     """
     Streaming version of agent_node that yields sentence-level updates.
     """
     messages = state["messages"]
     patient_info = state.get("patient_info") or PatientInfoExtraction()
-    relevant_history = messages[-6:]
     
-    system_prompt = build_system_prompt(patient_info, has_messages=bool(messages))
+    scripted = scripted_response(patient_info)
+    if scripted is not None:
+        yield {"sentence": scripted.content, "type": "sentence"}
+        yield {"messages": [scripted], "type": "final"}
+        return
     
-    tools = [update_patient_info, end_call, forward_call_to_human]
-    model = ChatGoogleGenerativeAI(
-        temperature=0.7,
-        model="gemini-flash-lite-latest",
-        api_key=GOOGLE_API_KEY
-    ).bind_tools(tools)
+    prompt_messages = build_prompt_messages(patient_info, messages)
+    cacheable = is_cacheable_turn(messages)
+    model = get_model(cacheable=cacheable)
     
     sentence_buffer = SentenceBuffer(min_words=5)
     full_response_content = ""
-    tool_calls = []
+    response_message = None  # Running sum of chunks; assembles tool_call_chunks
     
     try:
-        async for chunk in model.astream([system_prompt] + relevant_history):
+        if cacheable:
+            # Streaming bypasses the LLM cache, so fetch the whole reply in one call
+            stream = _as_single_chunk(model.ainvoke(prompt_messages))
+        else:
+            stream = model.astream(prompt_messages)
+        
+        async for chunk in stream:
+            response_message = chunk if response_message is None else response_message + chunk
+            
             if hasattr(chunk, 'content') and chunk.content:
                 token = chunk.content
                 full_response_content += token
@@ -49,24 +61,21 @@ async def agent_node_streaming(state: InterviewState) -> AsyncGenerator[dict, No
                 
                 if complete_sentence:
                     yield {"sentence": complete_sentence, "type": "sentence"}
-            
-            if hasattr(chunk, 'tool_calls') and chunk.tool_calls:
-                tool_calls.extend(chunk.tool_calls)
     
     except asyncio.CancelledError:
         print("[agent_node_streaming] Stream cancelled.")
         raise # Re-raise to be handled by producer
     except Exception as e:
-        print(f"Error during LLM stream: {e}")
-        traceback.print_exc()
+        logger.exception("Error during LLM stream: %s", e)
         
     final_sentence = sentence_buffer.mark_final()
     if final_sentence:
         yield {"sentence": final_sentence, "type": "sentence"}
         
+    tool_calls = getattr(response_message, "tool_calls", None) or []
     final_message = AIMessage(
         content=full_response_content,
-        tool_calls=tool_calls if tool_calls else []
+        tool_calls=tool_calls
     )
     
     yield {
@@ -80,10 +89,12 @@ async def llm_producer(
     session_id: str,
     user_message: str,
     sentence_queue: asyncio.Queue,
-    interruption_event: asyncio.Event
+    interruption_event: asyncio.Event,
+    state=None
 ):
     """
     Producer: Streams sentences from LLM and puts them in the queue.
+    state: optional prefetched checkpoint snapshot for this turn.
     """
     if agent_manager is None:
         print("Error: Agent Manager not set")
@@ -91,14 +102,14 @@ async def llm_producer(
         return
 
     try:
-        async for chunk in agent_manager.process_message_streaming(session_id, user_message):
+        async for chunk in agent_manager.process_message_streaming(session_id, user_message, state):
             if interruption_event.is_set():
                 print("[LLM Producer] Interruption detected, stopping.")
                 break # Exit loop if interrupted
                 
             if "sentence" in chunk:
                 sentence = chunk["sentence"]
-                print(f"[LLM→Queue] Sentence: {sentence[:50]}...")
+                logger.debug("[LLM→Queue] Sentence: %.50s...", sentence)
                 await sentence_queue.put(sentence)
             
             elif chunk.get("final"):
@@ -108,8 +119,7 @@ async def llm_producer(
     except asyncio.CancelledError:
         print("[LLM Producer] Cancelled.")
     except Exception as e:
-        print(f"[LLM Producer Error] {e}")
-        traceback.print_exc()
+        logger.exception("[LLM Producer Error] %s", e)
     finally:
         # CRITICAL: Always send sentinel to shut down tts_consumer
         print("[LLM Producer] Sending sentinel to TTS.")
@@ -118,13 +128,14 @@ async def llm_producer(
 
 async def tts_consumer(
     sentence_queue: asyncio.Queue,
-    audio_queue: asyncio.Queue,
+    audio_queue: AudioChunkRing,
     interruption_event: asyncio.Event,
     output_format: str = "wav"
 ):
     """
     Consumer: Takes sentences, synthesizes audio, and puts chunks in audio queue.
     """
+    loop = asyncio.get_running_loop()
     try:
         while True:
             if interruption_event.is_set():
@@ -139,33 +150,40 @@ async def tts_consumer(
                 sentence_queue.task_done()
                 break # Exit loop
                 
-            print(f"[Queue→TTS] Synthesizing for {output_format}: {sentence[:50]}...")
+            logger.debug("[Queue→TTS] Synthesizing for %s: %.50s...", output_format, sentence)
             
-            # Run blocking TTS in thread pool
-            loop = asyncio.get_event_loop()
-            audio_bytes = await loop.run_in_executor(
-                None, # Default thread pool
-                synthesize_speech_for_pipeline,
-                sentence,
-                output_format
-            )
-            
-            # Before putting in queue, check one last time
-            if interruption_event.is_set():
-                print("[TTS Consumer] Interrupted before sending audio chunk.")
-                sentence_queue.task_done()
-                break
-            
-            await audio_queue.put(audio_bytes)
-            print(f"[TTS→Audio Queue] Chunk ready ({len(audio_bytes)} bytes)")
+            # Pull each chunk from the blocking TTS generator in the thread pool
+            # and queue it right away, so playback starts before synthesis ends
+            chunks = synthesize_speech_stream(sentence, output_format)
+            interrupted = False
+            try:
+                while True:
+                    audio_bytes = await loop.run_in_executor(None, next, chunks, None)
+                    if audio_bytes is None:
+                        break
+                    
+                    # Before putting in queue, check one last time
+                    if interruption_event.is_set():
+                        print("[TTS Consumer] Interrupted before sending audio chunk.")
+                        interrupted = True
+                        break
+                    
+                    await audio_queue.put(audio_bytes)
+                    logger.debug("[TTS→Audio Queue] Chunk ready (%d bytes)", len(audio_bytes))
+            finally:
+                try:
+                    chunks.close()
+                except ValueError:
+                    pass  # Still running in the executor; closed when it is dropped
             
             sentence_queue.task_done()
+            if interrupted:
+                break
             
     except asyncio.CancelledError:
         print("[TTS Consumer] Cancelled.")
     except Exception as e:
-        print(f"[TTS Consumer Error] {e}")
-        traceback.print_exc()
+        logger.exception("[TTS Consumer Error] %s", e)
     # ---
     # !! REMOVED FLAWED FINALLY BLOCK !!
     # The agent_handler_task is responsible for clearing the audio_queue.
@@ -177,7 +195,7 @@ async def tts_consumer(
 
 
 async def audio_chunk_streamer(
-    audio_queue: asyncio.Queue
+    audio_queue: AudioChunkRing
 ) -> AsyncGenerator[bytes, None]:
     """
     Async generator that yields audio chunks as they become available.
@@ -202,6 +220,5 @@ async def audio_chunk_streamer(
             audio_queue.task_done()
             
     except Exception as e:
-        print(f"[Audio Streamer Error] {e}")
-        traceback.print_exc()
+        logger.exception("[Audio Streamer Error] %s", e)
 
@@ -154,7 +154,7 @@
 #                 # Reset interruption flag when new audio arrives
 #                 interruption_flag["interrupted"] = False
                 
-#                 audio_from_ai = base64.b64decode(data['audio'])
+#                 audio_from_ai = base64.b64decode(data['audio'], validate=False)
 #                 ai_sample_rate = data.get('sample_rate', 16000)
 
 #                 # Initialize downsampler on first audio
@@ -228,29 +228,52 @@ AudioSocket Relay - FIXED V2
 import asyncio
 import websockets
 import json
-import base64
+try:
+    import pybase64 as base64  # SIMD-accelerated drop-in for the stdlib module
+except ImportError:
+    import base64
 import struct
+import logging
+import os
 import audioop
 from datetime import datetime
 
 # --- CONFIGURATION ---
 LIGHTNING_AI_URL = "wss://8000-dep-01k92g7yv2tx4dsrq54rn6r5ak-d.cloudspaces.litng.ai/ws/vicidial"
+LIGHTNING_AI_CTRL_URL = "wss://8000-dep-01k92g7yv2tx4dsrq54rn6r5ak-d.cloudspaces.litng.ai/ws/vicidial_ctrl"
 HOST = "0.0.0.0"
 PORT = 9092
+LOG_LEVEL = os.environ.get("RELAY_LOG_LEVEL", "INFO").upper()  # DEBUG shows per-frame audio
+
+logger = logging.getLogger("relay")
 
 # --- PROTOCOL CONSTANTS ---
 TYPE_UUID = 0x01
 TYPE_AUDIO_SLIN8K = 0x10
 TYPE_HANGUP = 0x00
+AUDIOSOCKET_HEADER = struct.Struct('>BH')  # type, payload length
 
 # --- AUDIO CONSTANTS ---
 ASTERISK_CHUNK_MS = 20
 ASTERISK_SAMPLE_RATE = 8000
 ASTERISK_SAMPLE_WIDTH = 2
 ASTERISK_CHUNK_BYTES = 320  # 20ms @ 8kHz
+PLAYBACK_COMPACT_BYTES = 32000  # Drop consumed playback audio every ~2s
 
 AGENT_SAMPLE_RATE = 16000
 
+# Backend binary frames: 1-byte tag + payload
+WS_FRAME_AUDIO = 0x01       # raw PCM16 @ 16kHz
+WS_FRAME_INTERRUPT = 0x02
+WS_FRAME_TRANSCRIPT = 0x03  # UTF-8 text
+WS_FRAME_HANGUP = 0x04
+WS_FRAME_AUDIO_8K = 0x05    # raw PCM16 @ 8kHz, upsampled by the backend
+WS_FRAME_RESUME = 0x06      # epoch; audio before it is from the interrupted turn
+WS_EPOCH = struct.Struct(">I")  # Interrupt/resume epoch payload
+WS_FRAME_AUDIO_TAG = bytes([WS_FRAME_AUDIO])
+WS_FRAME_AUDIO_8K_TAG = bytes([WS_FRAME_AUDIO_8K])
+WS_FRAME_HANGUP_TAG = bytes([WS_FRAME_HANGUP])
+
 class AudioResampler:
     """Stateful resampler"""
     def __init__(self, from_rate, to_rate, width):
@@ -283,25 +306,36 @@ async def handle_call(reader, writer):
         uuid = uuid_frame[3:].hex()
         print(f"[{session_id}] 🆔 UUID: {uuid}")
 
-        ws_url = f"{LIGHTNING_AI_URL}/{session_id}"
+        ws_url = f"{LIGHTNING_AI_URL}/{session_id}?proto=binary"
+        ctrl_url = f"{LIGHTNING_AI_CTRL_URL}/{session_id}"
         print(f"[{session_id}] 🔗 Connecting to AI...")
 
-        async with websockets.connect(ws_url, ping_interval=20) as ws:
+        # Control channel first so interrupts never queue behind audio
+        async with websockets.connect(ctrl_url, ping_interval=20) as ctrl_ws, \
+                   websockets.connect(ws_url, ping_interval=20) as ws:
             print(f"[{session_id}] ✅ Connected")
             
-            upsampler = AudioResampler(ASTERISK_SAMPLE_RATE, AGENT_SAMPLE_RATE, ASTERISK_SAMPLE_WIDTH)
             downsampler = AudioResampler(AGENT_SAMPLE_RATE, ASTERISK_SAMPLE_RATE, ASTERISK_SAMPLE_WIDTH)
             
-            # Shared state for interruption
+            # Shared state for interruption: audio is dropped while the
+            # latest interrupt epoch is ahead of the latest resume epoch
             playback_state = {
-                "interrupted": False,
+                "interrupt_epoch": 0,
+                "resume_epoch": 0,
+                "on_interrupt": None,
                 "downsampler": downsampler
             }
             
-            await asyncio.gather(
-                forward_asterisk_to_ai(reader, ws, session_id, upsampler),
-                forward_ai_to_asterisk(ws, writer, session_id, playback_state)
+            control_task = asyncio.create_task(
+                forward_ai_control(ctrl_ws, session_id, playback_state)
             )
+            try:
+                await asyncio.gather(
+                    forward_asterisk_to_ai(reader, ws, session_id),
+                    forward_ai_to_asterisk(ws, writer, session_id, playback_state)
+                )
+            finally:
+                control_task.cancel()
 
     except Exception as e:
         print(f"[{session_id}] ❌ Error: {e}")
@@ -310,119 +344,209 @@ async def handle_call(reader, writer):
         await writer.wait_closed()
         print(f"[{session_id}] 📴 Ended")
 
-async def forward_asterisk_to_ai(reader, ws, session_id, upsampler):
-    """Asterisk (8k) → AI (16k)"""
+async def forward_asterisk_to_ai(reader, ws, session_id):
+    """Asterisk (8k) → AI (backend upsamples to 16k)"""
     count = 0
     try:
         while True:
-            header = await reader.read(3)
-            if not header or len(header) < 3:
+            try:
+                header = await reader.readexactly(AUDIOSOCKET_HEADER.size)
+            except asyncio.IncompleteReadError:
                 break
 
-            frame_type, length = header[0], struct.unpack('>H', header[1:3])[0]
+            frame_type, length = AUDIOSOCKET_HEADER.unpack(header)
 
             if frame_type == TYPE_HANGUP:
                 print(f"[{session_id}] ☎️  Hangup")
-                await ws.send(json.dumps({"type": "hangup"}))
+                await ws.send(WS_FRAME_HANGUP_TAG)
                 break
 
-            if frame_type != TYPE_AUDIO_SLIN8K:
-                await reader.read(length)
-                continue
-
-            audio_8k = await reader.read(length)
-            if not audio_8k:
+            try:
+                payload = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
                 break
 
-            audio_16k = upsampler.resample(audio_8k)
+            if frame_type != TYPE_AUDIO_SLIN8K:
+                continue
 
             count += 1
-            await ws.send(json.dumps({
-                "type": "audio_data",
-                "audio": base64.b64encode(audio_16k).decode(),
-                "format": "pcm16k"
-            }))
+            await ws.send(WS_FRAME_AUDIO_8K_TAG + payload)
 
             if count % 50 == 0:
-                print(f"[{session_id}] 📊 {count} packets → AI")
+                logger.debug("[%s] 📊 %d packets → AI", session_id, count)
 
     except Exception as e:
         print(f"[{session_id}] ⚠️  A→AI: {e}")
 
+async def forward_ai_control(ctrl_ws, session_id, playback_state):
+    """Interrupts and transcripts from the AI control channel."""
+    try:
+        while True:
+            data = json.loads(await ctrl_ws.recv())
+
+            if data.get('type') == 'interrupt':
+                # Can overtake audio already on the media socket; that audio
+                # is dropped until the server's matching resume marker
+                print(f"[{session_id}] 🚨 INTERRUPT signal (control channel)")
+                on_interrupt = playback_state["on_interrupt"]
+                if on_interrupt is not None:
+                    on_interrupt(data['epoch'])
+                else:
+                    playback_state["interrupt_epoch"] = max(playback_state["interrupt_epoch"], data['epoch'])
+
+            elif data.get('type') == 'transcript':
+                print(f"[{session_id}] 📝 User: {data['text']}")
+
+    except websockets.exceptions.ConnectionClosed:
+        print(f"[{session_id}] 🔌 Control channel closed")
+    except Exception as e:
+        print(f"[{session_id}] ⚠️  Control: {e}")
+
 async def forward_ai_to_asterisk(ws, writer, session_id, playback_state):
     """
     AI (16k) → Asterisk (8k)
     
     CRITICAL CHANGES:
-    1. Check interrupt flag BEFORE each chunk write
-    2. Clear buffer IMMEDIATELY on interrupt
-    3. Reset downsampler state on interrupt
+    1. Clear buffer IMMEDIATELY on interrupt (from either socket)
+    2. Reset downsampler state on interrupt
+    3. Drop audio from the interrupted turn until the server's resume marker
     4. Don't accumulate audio in buffer - stream directly
     """
     downsampler = playback_state["downsampler"]
+    # Playback audio is consumed through a read index instead of re-slicing
+    # the remaining buffer on every 20ms frame
     audio_buffer = bytearray()
+    read_pos = 0
     currently_playing = False
+    playback_task = None
     
     def write_audio_frame(data_8k):
-        frame = struct.pack('B', TYPE_AUDIO_SLIN8K) + struct.pack('>H', len(data_8k)) + data_8k
+        frame = AUDIOSOCKET_HEADER.pack(TYPE_AUDIO_SLIN8K, len(data_8k)) + data_8k
         writer.write(frame)
     
+    def clear_audio():
+        nonlocal read_pos
+        audio_buffer.clear()
+        read_pos = 0
+    
+    def compact_audio():
+        """Drop already-sent bytes from the front of the buffer."""
+        nonlocal read_pos
+        del audio_buffer[:read_pos]
+        read_pos = 0
+    
+    def is_stale():
+        """True between an interrupt and the server's matching resume."""
+        return playback_state["interrupt_epoch"] > playback_state["resume_epoch"]
+    
+    def interrupt(epoch):
+        """Stop playback now and start dropping the interrupted turn's audio."""
+        nonlocal currently_playing
+        if epoch <= playback_state["resume_epoch"]:
+            return  # Already resumed past it; current audio is a newer turn
+        playback_state["interrupt_epoch"] = max(playback_state["interrupt_epoch"], epoch)
+        if playback_task is not None:
+            playback_task.cancel()
+        if len(audio_buffer) > read_pos:
+            print(f"[{session_id}] ⏹️  Playback interrupted (buffer had {len(audio_buffer) - read_pos} bytes)")
+        clear_audio()
+        downsampler.reset_state()
+        currently_playing = False
+    
+    def resume(epoch):
+        playback_state["resume_epoch"] = max(playback_state["resume_epoch"], epoch)
+        if not is_stale():
+            print(f"[{session_id}] ▶️  Resume (epoch {epoch})")
+    
+    playback_state["on_interrupt"] = interrupt
+    
+    def play(audio_16k):
+        nonlocal currently_playing, playback_task
+        audio_8k = downsampler.resample(audio_16k)
+        audio_buffer.extend(audio_8k)
+        if not currently_playing:
+            currently_playing = True
+            playback_task = asyncio.create_task(send_buffered_audio())
+        return audio_8k
+    
     async def send_buffered_audio():
-        """Send all buffered audio in 20ms chunks with interruption checks."""
-        nonlocal audio_buffer, currently_playing
+        """Send all buffered audio in 20ms chunks; cancelled on interrupt."""
+        nonlocal read_pos, currently_playing
         
-        while len(audio_buffer) >= ASTERISK_CHUNK_BYTES:
-            # CRITICAL: Check interruption BEFORE each chunk
-            if playback_state["interrupted"]:
-                print(f"[{session_id}] ⏹️  Playback interrupted (buffer had {len(audio_buffer)} bytes)")
-                audio_buffer.clear()
-                currently_playing = False
-                playback_state["interrupted"] = False  # Reset flag
-                downsampler.reset_state()  # Reset resampler state
-                return
-            
-            chunk = audio_buffer[:ASTERISK_CHUNK_BYTES]
-            audio_buffer = audio_buffer[ASTERISK_CHUNK_BYTES:]
+        while len(audio_buffer) - read_pos >= ASTERISK_CHUNK_BYTES:
+            end = read_pos + ASTERISK_CHUNK_BYTES
+            write_audio_frame(audio_buffer[read_pos:end])
+            read_pos = end
+            if read_pos >= PLAYBACK_COMPACT_BYTES:
+                compact_audio()
             
-            write_audio_frame(chunk)
             await writer.drain()
             await asyncio.sleep(0.02)  # 20ms pacing
         
+        compact_audio()
         currently_playing = False
     
     try:
         while True:
             msg = await ws.recv()
+            
+            if isinstance(msg, bytes):
+                if not msg:
+                    continue
+                
+                # Control frames (only used when the control channel is down)
+                if msg[0] == WS_FRAME_INTERRUPT:
+                    print(f"[{session_id}] 🚨 INTERRUPT signal - clearing everything")
+                    interrupt(WS_EPOCH.unpack_from(msg, 1)[0])
+                    continue
+                
+                # Turn boundary (always on the media socket, behind the stale audio)
+                if msg[0] == WS_FRAME_RESUME:
+                    resume(WS_EPOCH.unpack_from(msg, 1)[0])
+                    continue
+                
+                if msg[0] == WS_FRAME_TRANSCRIPT:
+                    print(f"[{session_id}] 📝 User: {msg[1:].decode()}")
+                    continue
+                
+                # Binary audio frame
+                if msg[0] != WS_FRAME_AUDIO:
+                    continue
+                
+                # Audio from the interrupted turn still in flight
+                if is_stale():
+                    continue
+                
+                audio_from_ai = memoryview(msg)[1:]
+                audio_8k = play(audio_from_ai)
+                
+                logger.debug("[%s] 🔊 Rx %dB @%dHz → %dB @8kHz", session_id, len(audio_from_ai), AGENT_SAMPLE_RATE, len(audio_8k))
+                continue
+            
             data = json.loads(msg)
 
             # Handle interrupt signal
             if data.get('type') == 'interrupt':
                 print(f"[{session_id}] 🚨 INTERRUPT signal - clearing everything")
-                playback_state["interrupted"] = True
-                audio_buffer.clear()
-                downsampler.reset_state()
-                currently_playing = False
+                interrupt(data['epoch'])
+                continue
+
+            if data.get('type') == 'resume':
+                resume(data['epoch'])
                 continue
 
             if data.get('type') == 'audio_response':
-                # Reset interrupt flag when new audio arrives
-                playback_state["interrupted"] = False
+                # Audio from the interrupted turn still in flight
+                if is_stale():
+                    continue
                 
                 audio_from_ai = base64.b64decode(data['audio'])
                 ai_sample_rate = data.get('sample_rate', 16000)
 
-                # Downsample to 8k
-                audio_8k = downsampler.resample(audio_from_ai)
+                # Downsample to 8k and queue for playback
+                audio_8k = play(audio_from_ai)
                 
-                print(f"[{session_id}] 🔊 Rx {len(audio_from_ai)}B @{ai_sample_rate}Hz → {len(audio_8k)}B @8kHz")
-
-                # Add to buffer
-                audio_buffer.extend(audio_8k)
-                
-                # Start playback task if not already playing
-                if not currently_playing:
-                    currently_playing = True
-                    asyncio.create_task(send_buffered_audio())
+                logger.debug("[%s] 🔊 Rx %dB @%dHz → %dB @8kHz", session_id, len(audio_from_ai), ai_sample_rate, len(audio_8k))
 
             elif data.get('type') == 'transcript':
                 print(f"[{session_id}] 📝 User: {data['text']}")
@@ -448,6 +572,12 @@ async def main():
         await server.serve_forever()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     try:
         asyncio.run(main())
     except KeyboardInterrupt: